@@ -0,0 +1,126 @@
+"""
+Benchmark the Decision Model Cascade
+Compares small-then-large cascading with always using the large model,
+against a stub Ollama server with per-model latency and accuracy
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decision_cascade import decision_payload, run_decision_cascade
+from ollama_pool import OllamaPool
+from ollama_stub import OllamaStub
+
+DECISIONS = ['APPROVED', 'DENIED', 'ADDITIONAL_INFO_NEEDED']
+
+
+def simulated_decision(verdict, confidence, consistent=True):
+    """Decision JSON whose criteria agree (or not) with the verdict"""
+    status = 'MET' if (verdict == 'APPROVED') == consistent else 'NOT_MET'
+    return {
+        'decision': verdict,
+        'confidence': confidence,
+        'criteria_met': [{'criterion': 'Conservative treatment', 'status': status, 'evidence': 'stub'}],
+        'reasoning': 'stub',
+        'missing_documentation': ['imaging report'] if verdict == 'ADDITIONAL_INFO_NEEDED' and consistent else [],
+        'recommendation': 'stub'
+    }
+
+
+class SimulatedModels:
+    """Deterministic per-case behaviour for a small and a large model
+
+    The large model always returns the case's true verdict. The small model
+    is confident on easy cases (and occasionally wrong); on hard cases it
+    answers with MEDIUM/LOW confidence or inconsistent criteria.
+    """
+
+    def __init__(self, small_model, easy_fraction, small_error_rate, seed=0):
+        self.small_model = small_model
+        self.easy_fraction = easy_fraction
+        self.small_error_rate = small_error_rate
+        self.seed = seed
+
+    def case(self, case_no):
+        rng = random.Random(self.seed * 1000003 + case_no)
+        truth = rng.choice(DECISIONS)
+        easy = rng.random() < self.easy_fraction
+        wrong = rng.random() < self.small_error_rate
+        return rng, truth, easy, wrong
+
+    def __call__(self, payload):
+        case_no = int(re.search(r'CASE-(\d+)', payload['prompt']).group(1))
+        rng, truth, easy, wrong = self.case(case_no)
+
+        if payload['model'] != self.small_model:
+            return json.dumps(simulated_decision(truth, 'HIGH'))
+        if not easy:
+            if rng.random() < 0.5:
+                return json.dumps(simulated_decision(truth, rng.choice(['MEDIUM', 'LOW'])))
+            return json.dumps(simulated_decision(truth, 'HIGH', consistent=False))
+        verdict = rng.choice([d for d in DECISIONS if d != truth]) if wrong else truth
+        return json.dumps(simulated_decision(verdict, 'HIGH'))
+
+
+def run(pool, tiers, cases, concurrency):
+    payloads = [decision_payload(f"PATIENT CASE: CASE-{i}") for i in range(cases)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        decisions = list(executor.map(lambda p: run_decision_cascade(p, tiers=tiers, pool=pool), payloads))
+    return time.perf_counter() - start, decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decision model cascade on a stub server")
+    parser.add_argument('--cases', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--small-model', default='llama3.2:1b')
+    parser.add_argument('--large-model', default='llama3.2')
+    parser.add_argument('--small-latency', type=float, default=0.05)
+    parser.add_argument('--large-latency', type=float, default=0.25)
+    parser.add_argument('--easy-fractions', default="0.5,0.7,0.9")
+    parser.add_argument('--small-error-rate', type=float, default=0.03)
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("DECISION CASCADE BENCHMARK")
+    print("=" * 70)
+    print(f" {args.cases} cases, concurrency {args.concurrency}, "
+          f"latency {args.small_model}={args.small_latency}s {args.large_model}={args.large_latency}s")
+
+    large_only = [{'model': args.large_model}]
+    cascade = [{'model': args.small_model, 'accept_confidence': ['HIGH']}, {'model': args.large_model}]
+
+    print(f"\n{'Easy %':>7} {'Large cases/s':>14} {'Cascade cases/s':>16} {'Gain':>6} "
+          f"{'Small-tier %':>13} {'Disagree %':>11}")
+    print("-" * 70)
+
+    for easy_fraction in [float(f) for f in args.easy_fractions.split(',')]:
+        models = SimulatedModels(args.small_model, easy_fraction, args.small_error_rate)
+
+        def latency(payload):
+            return args.small_latency if payload['model'] == args.small_model else args.large_latency
+
+        with OllamaStub(responder=models, latency=latency) as stub:
+            pool = OllamaPool([stub.url])
+            large_time, large_decisions = run(pool, large_only, args.cases, args.concurrency)
+            cascade_time, cascade_decisions = run(pool, cascade, args.cases, args.concurrency)
+            pool.close()
+
+        small_tier = sum(1 for d in cascade_decisions if d['decided_by']['tier'] == 0)
+        disagree = sum(
+            1 for a, b in zip(large_decisions, cascade_decisions) if a['decision'] != b['decision']
+        )
+        print(f"{easy_fraction * 100:>6.0f}% {args.cases / large_time:>14.1f} "
+              f"{args.cases / cascade_time:>16.1f} {large_time / cascade_time:>5.2f}x "
+              f"{small_tier / args.cases * 100:>12.1f}% {disagree / args.cases * 100:>10.1f}%")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark Urgency-Aware Scheduling
+Submits a mixed emergent/urgent/elective decision load faster than a stub
+Ollama server can serve it, then compares per-class latency and SLA hits
+for FIFO order vs. the priority scheduler
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmark_cascade import simulated_decision
+from decision_cascade import decision_payload, run_decision_cascade
+from ollama_pool import OllamaPool
+from ollama_stub import OllamaStub
+from priority_scheduler import URGENCY_LEVELS, PriorityScheduler
+
+
+def workload(requests, mix, seed=0):
+    """Urgency class per request, drawn from the emergent/urgent/elective mix"""
+    rng = random.Random(seed)
+    return rng.choices(URGENCY_LEVELS, weights=mix, k=requests)
+
+
+def run(pool, urgencies, arrival_rate, concurrency, reserved, aging, sla, fifo):
+    """Latency per request (by its real urgency) and the scheduler's aging counts"""
+    scheduler = PriorityScheduler(
+        max_concurrency=concurrency,
+        reserved_slots=0 if fifo else reserved,
+        aging_seconds=0 if fifo else aging
+    )
+    tiers = [{'model': 'llama3.2'}]
+    latencies = [None] * len(urgencies)
+    futures = []
+    start = time.perf_counter()
+    for i, urgency in enumerate(urgencies):
+        # Open-loop arrivals: requests keep coming whether or not we keep up
+        delay = start + i / arrival_rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        submitted = time.perf_counter()
+        future = scheduler.submit(
+            run_decision_cascade, decision_payload(f"PATIENT CASE: CASE-{i}"), tiers=tiers, pool=pool,
+            # FIFO: every request lands in one queue, in arrival order
+            urgency='elective' if fifo else urgency
+        )
+        future.add_done_callback(
+            lambda _, i=i, submitted=submitted: latencies.__setitem__(i, time.perf_counter() - submitted)
+        )
+        futures.append(future)
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    promoted = {u: s['promoted'] for u, s in scheduler.stats().items()}
+    scheduler.shutdown()
+
+    stats = {}
+    for urgency in URGENCY_LEVELS:
+        samples = sorted(l for u, l in zip(urgencies, latencies) if u == urgency)
+        n = len(samples)
+        stats[urgency] = {
+            'completed': n,
+            'promoted': 0 if fifo else promoted[urgency],
+            'latency_p50': samples[min(n - 1, int(0.50 * n))] if n else None,
+            'latency_p95': samples[min(n - 1, int(0.95 * n))] if n else None,
+            'latency_max': samples[-1] if n else None,
+            'sla_met_rate': sum(1 for l in samples if l <= sla[urgency]) / n if n else None
+        }
+    return elapsed, stats
+
+
+def print_stats(label, elapsed, stats):
+    print(f"\n{label} ({elapsed:.1f}s)")
+    print(f"{'Class':<10} {'Done':>6} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'SLA met':>8} {'Aged':>6}")
+    print("-" * 70)
+    for urgency in URGENCY_LEVELS:
+        s = stats[urgency]
+        if not s['completed']:
+            continue
+        print(f"{urgency:<10} {s['completed']:>6} {s['latency_p50']:>8.2f} {s['latency_p95']:>8.2f} "
+              f"{s['latency_max']:>8.2f} {s['sla_met_rate'] * 100:>7.1f}% {s['promoted']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark urgency-aware scheduling on a stub server")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--arrival-rate', type=float, default=45.0, help="Requests per second")
+    parser.add_argument('--latency', type=float, default=0.1, help="Stub seconds per generation")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--reserved', type=int, default=1)
+    parser.add_argument('--aging', type=float, default=5.0, help="Seconds of waiting per priority level")
+    parser.add_argument('--mix', default="0.05,0.15,0.80", help="emergent,urgent,elective fractions")
+    parser.add_argument('--sla', default="0.5,2,30", help="emergent,urgent,elective SLA seconds")
+    args = parser.parse_args()
+
+    mix = [float(x) for x in args.mix.split(',')]
+    sla = dict(zip(URGENCY_LEVELS, (float(x) for x in args.sla.split(','))))
+    urgencies = workload(args.requests, mix)
+    capacity = args.concurrency / args.latency
+
+    print("\n" + "=" * 70)
+    print("PRIORITY SCHEDULING BENCHMARK")
+    print("=" * 70)
+    print(f" {args.requests} requests at {args.arrival_rate:.0f}/s, capacity ~{capacity:.0f}/s "
+          f"({args.concurrency} slots, {args.reserved} reserved)")
+    print(f" Mix: " + ", ".join(f"{u} {urgencies.count(u)}" for u in URGENCY_LEVELS))
+    print(f" SLA: " + ", ".join(f"{u} {sla[u]:g}s" for u in URGENCY_LEVELS))
+
+    responder = lambda payload: json.dumps(simulated_decision('APPROVED', 'HIGH'))
+    with OllamaStub(responder=responder, latency=args.latency) as stub:
+        pool = OllamaPool([stub.url])
+        for label, fifo in (('FIFO (arrival order)', True), ('Priority scheduler', False)):
+            elapsed, stats = run(pool, urgencies, args.arrival_rate, args.concurrency,
+                                 args.reserved, args.aging, sla, fifo)
+            print_stats(label, elapsed, stats)
+        pool.close()
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark Schema-Constrained Generation
+Compares plain JSON mode with schema-constrained, length-capped generation
+for extraction and decision prompts against a running Ollama
+"""
+
+import argparse
+import json
+import time
+
+import pandas as pd
+
+from decision_cascade import DEFAULT_DECISION_MODEL, decision_payload
+from ollama_pool import get_pool
+from process_cases_ollama import build_extraction_prompt, extraction_payload
+from prior_auth_ollama import PriorAuthSystemOllama
+from schemas import generation_stats, parse_decision, parse_extraction
+
+SAMPLE_POLICY = """COVERAGE CRITERIA (Must meet ALL)
+- Minimum 6 weeks of documented conservative treatment (physical therapy, NSAIDs)
+- MRI within 6 months confirming nerve root compression
+- Radicular pain with correlating neurological deficit"""
+
+SAMPLE_CASE = """Patient: 58-year-old male with lower back pain radiating to the left leg for 8 months.
+Completed 12 weeks of physical therapy, 10 weeks of NSAIDs and 3 epidural injections.
+Positive straight leg raise, decreased L5 sensation, ankle weakness 4/5.
+MRI lumbar spine: L4-L5 disc herniation with severe nerve compression."""
+
+
+def run_calls(prompts, build_payload, parse, model):
+    """Return per-call stats for every prompt"""
+    results = []
+    for prompt in prompts:
+        payload = dict(build_payload(prompt), model=model)
+        start = time.perf_counter()
+        body = get_pool().generate(payload, timeout=300)
+        wall = time.perf_counter() - start
+        try:
+            parse(body['response'])
+            valid = True
+        except Exception:
+            valid = False
+        stats = generation_stats(body)
+        stats.update({'wall_seconds': wall, 'valid': valid})
+        results.append(stats)
+    return results
+
+
+def summarize(label, results):
+    n = len(results)
+    return {
+        'mode': label,
+        'calls': n,
+        'output_tokens': sum(r['output_tokens'] or 0 for r in results) / n,
+        'wall_seconds': sum(r['wall_seconds'] for r in results) / n,
+        'valid_rate': sum(r['valid'] for r in results) / n
+    }
+
+
+def report(title, plain, constrained):
+    print(f"\n {title}")
+    print(f"   {'Mode':<12} {'Out tokens':>11} {'Wall s':>8} {'Valid':>7}")
+    for row in (plain, constrained):
+        print(f"   {row['mode']:<12} {row['output_tokens']:>11.1f} {row['wall_seconds']:>8.2f} "
+              f"{row['valid_rate'] * 100:>6.0f}%")
+    print(f"   Saved per call: {plain['output_tokens'] - constrained['output_tokens']:.1f} output tokens, "
+          f"{plain['wall_seconds'] - constrained['wall_seconds']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark schema-constrained generation")
+    parser.add_argument('--input', default="data/raw/mtsamples.csv")
+    parser.add_argument('--cases', type=int, default=20)
+    parser.add_argument('--decisions', type=int, default=5)
+    parser.add_argument('--model', default=DEFAULT_DECISION_MODEL)
+    parser.add_argument('--output', default="data/schema_benchmark.json")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("SCHEMA-CONSTRAINED GENERATION BENCHMARK")
+    print("=" * 70)
+
+    df = pd.read_csv(args.input).dropna(subset=['transcription']).head(args.cases)
+    extraction_prompts = [
+        build_extraction_prompt(row['transcription'], row['medical_specialty'])
+        for _, row in df.iterrows()
+    ]
+
+    def plain_payload(prompt):
+        return {'prompt': prompt, 'stream': False, 'format': 'json'}
+
+    extraction = (
+        summarize('json', run_calls(extraction_prompts, plain_payload, parse_extraction, args.model)),
+        summarize('schema', run_calls(extraction_prompts, extraction_payload, parse_extraction, args.model))
+    )
+    report(f"EXTRACTION ({len(extraction_prompts)} transcriptions)", *extraction)
+
+    decision_prompt = PriorAuthSystemOllama.build_decision_prompt(
+        SAMPLE_CASE, "Lumbar Microdiscectomy", SAMPLE_POLICY, []
+    )
+    decision_prompts = [decision_prompt] * args.decisions
+    decision = (
+        summarize('json', run_calls(decision_prompts, plain_payload, parse_decision, args.model)),
+        summarize('schema', run_calls(decision_prompts, decision_payload, parse_decision, args.model))
+    )
+    report(f"DECISION ({args.decisions} calls)", *decision)
+
+    with open(args.output, 'w') as f:
+        json.dump({'extraction': extraction, 'decision': decision}, f, indent=2)
+    print(f"\n Results saved to: {args.output}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
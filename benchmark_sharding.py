@@ -0,0 +1,121 @@
+"""
+Benchmark Sharded Case Search
+Checks that scatter-gather results match the unsharded index exactly and
+measures query latency/throughput as the shard count grows
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from sharded_index import ShardServer, ShardedCaseIndex, shard_path, write_shards
+
+
+def random_unit_vectors(n, dim, seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def time_queries(search, queries, batch_size):
+    """Return (seconds, results) for running every query batch through search"""
+    results = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        results.extend(search(queries[i:i + batch_size]))
+    return time.perf_counter() - start, results
+
+
+def start_servers(shard_root, num_shards, base_port):
+    """Start in-process ShardServers (stand-ins for remote nodes)"""
+    import threading
+    servers, addresses = [], []
+    for shard_id in range(num_shards):
+        server = ShardServer(('127.0.0.1', base_port + shard_id), shard_path(shard_root, shard_id))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        addresses.append(f"127.0.0.1:{base_port + shard_id}")
+    return servers, addresses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded case search")
+    parser.add_argument('--vectors', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--shards', default="1,2,4,8")
+    parser.add_argument('--remote', action='store_true', help="Use TCP shard servers instead of processes")
+    parser.add_argument('--base-port', type=int, default=9200)
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("SHARDED SEARCH BENCHMARK")
+    print("=" * 70)
+    print(f" Corpus: {args.vectors} x {args.dim}, {args.queries} queries, k={args.k}")
+
+    corpus = random_unit_vectors(args.vectors, args.dim, seed=0)
+    queries = random_unit_vectors(args.queries, args.dim, seed=1)
+    metadata = [{'case_id': f"case_{i:07d}"} for i in range(args.vectors)]
+
+    index = faiss.IndexFlatIP(args.dim)
+    index.add(corpus)
+
+    def flat_search(batch):
+        sims, ids = index.search(batch, args.k)
+        return [list(zip(row_sims.tolist(), row_ids.tolist())) for row_sims, row_ids in zip(sims, ids)]
+
+    baseline_time, baseline = time_queries(flat_search, queries, args.batch_size)
+    print(f"\n Unsharded: {baseline_time / args.queries * 1000:.2f} ms/query "
+          f"({args.queries / baseline_time:.0f} QPS)")
+
+    workdir = tempfile.mkdtemp(prefix="shards_")
+    try:
+        print(f"\n{'Shards':>8} {'ms/query':>10} {'QPS':>8} {'Speedup':>8} {'Identical':>10}")
+        print("-" * 50)
+        for num_shards in [int(n) for n in args.shards.split(',')]:
+            shard_root = os.path.join(workdir, f"n{num_shards}")
+            write_shards(corpus, metadata, shard_root, num_shards)
+
+            servers = []
+            if args.remote:
+                servers, addresses = start_servers(shard_root, num_shards, args.base_port)
+                args.base_port += num_shards
+                sharded = ShardedCaseIndex(servers=addresses)
+            else:
+                sharded = ShardedCaseIndex(shard_root=shard_root)
+
+            def sharded_search(batch):
+                return [
+                    [(score, global_id) for score, global_id, _ in hits]
+                    for hits in sharded.search(batch, args.k)
+                ]
+
+            elapsed, results = time_queries(sharded_search, queries, args.batch_size)
+            identical = all(
+                [gid for _, gid in got] == [gid for _, gid in want]
+                and np.array_equal(np.float32([s for s, _ in got]), np.float32([s for s, _ in want]))
+                for got, want in zip(results, baseline)
+            )
+            print(f"{num_shards:>8} {elapsed / args.queries * 1000:>10.2f} "
+                  f"{args.queries / elapsed:>8.0f} {baseline_time / elapsed:>7.2f}x {str(identical):>10}")
+
+            sharded.close()
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
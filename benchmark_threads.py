@@ -0,0 +1,112 @@
+"""
+Benchmark CPU Thread Budgets
+Runs several co-located worker processes (embedding + FAISS search, like
+PriorAuthSystemOllama) and reports aggregate throughput per thread budget
+"""
+
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from thread_budget import ThreadBudget, available_cpus, split_cpus
+
+DIMENSION = 384
+SAMPLE_TEXTS = [
+    "Patient with chronic lower back pain radiating to left leg for 6 months, failed physical therapy",
+    "65 year old with exertional chest pain, abnormal stress test, requesting cardiac catheterization",
+    "Right knee pain with mechanical locking after twisting injury, MRI shows meniscal tear",
+    "Persistent headaches with visual disturbance, neurological exam shows papilledema"
+]
+
+
+def _worker(budget, ready, go, results, vectors, query_batch, encode_batch, duration, faiss_only):
+    applied = budget.apply() if budget else {}
+
+    import faiss
+    index = faiss.IndexFlatIP(DIMENSION)
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((vectors, DIMENSION)).astype('float32')
+    faiss.normalize_L2(data)
+    index.add(data)
+    queries = data[rng.integers(0, vectors, size=query_batch)]
+
+    model = None
+    if not faiss_only:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer('all-MiniLM-L6-v2')
+        texts = (SAMPLE_TEXTS * (encode_batch // len(SAMPLE_TEXTS) + 1))[:encode_batch]
+        model.encode(texts[:1])
+
+    ready.put(applied)
+    go.wait()
+
+    requests = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        if model is not None:
+            queries = model.encode(texts, normalize_embeddings=True).astype('float32')
+        index.search(queries, 10)
+        requests += len(queries)
+    results.put((requests, time.perf_counter() - start))
+
+
+def run(processes, threads, pin, args):
+    """Aggregate requests/s for `processes` workers at `threads` each (0 = defaults)"""
+    ctx = mp.get_context('spawn')
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    cpus = split_cpus(processes, threads) if pin and threads else [None] * processes
+    workers = []
+    for slot in range(processes):
+        budget = ThreadBudget(threads=threads, cpus=cpus[slot]) if threads else None
+        worker = ctx.Process(target=_worker, args=(
+            budget, ready, go, results, args.vectors, args.query_batch,
+            args.encode_batch, args.duration, args.faiss_only
+        ))
+        worker.start()
+        workers.append(worker)
+
+    for _ in workers:
+        ready.get()
+    go.set()
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return sum(requests / elapsed for requests, elapsed in totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate throughput of co-located workers per thread budget")
+    parser.add_argument('--processes', type=int, default=4, help="Co-located worker processes")
+    parser.add_argument('--budgets', default="0,1,2,4", help="Threads per process (0 = library defaults)")
+    parser.add_argument('--pin', action='store_true', help="Pin each process to its own CPUs")
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--vectors', type=int, default=50000)
+    parser.add_argument('--query-batch', type=int, default=16)
+    parser.add_argument('--encode-batch', type=int, default=16)
+    parser.add_argument('--faiss-only', action='store_true', help="Skip the embedding model")
+    args = parser.parse_args()
+
+    cores = len(available_cpus())
+    print("\n" + "=" * 70)
+    print("THREAD BUDGET BENCHMARK")
+    print("=" * 70)
+    print(f" {args.processes} processes on {cores} CPUs, {args.duration:.0f}s each, "
+          f"{'FAISS only' if args.faiss_only else 'encode + FAISS search'}")
+
+    print(f"\n{'Threads/proc':>12} {'Total threads':>14} {'Requests/s':>12} {'vs. first':>12}")
+    print("-" * 70)
+    baseline = None
+    for threads in [int(b) for b in args.budgets.split(',')]:
+        throughput = run(args.processes, threads, args.pin, args)
+        baseline = baseline or throughput
+        label = str(threads) if threads else "default"
+        total = f"{threads * args.processes}" if threads else f"~{cores * args.processes}"
+        print(f"{label:>12} {total:>14} {throughput:>12.1f} {throughput / baseline:>11.2f}x")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
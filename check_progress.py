@@ -5,6 +5,7 @@ Monitor Processing Progress
 import os
 import json
 from datetime import datetime
+from index_manifest import index_status
 
 def check_progress():
     """Check current processing status"""
@@ -47,13 +48,36 @@ def check_progress():
         else:
             print(f"   Status: Complete!")
     else:
+        case_count = 0
         print(f"\n PATIENT CASES: 0/4,966")
         print(f"   Status: Not started")
     
-    # Check embeddings
+    # Check work queue (multi-worker extraction)
+    if os.path.exists("data/work_queue.db"):
+        from work_queue import WorkQueue
+        queue = WorkQueue("data/work_queue.db")
+        counts = queue.counts()
+        queue.close()
+        print(f"\n WORK QUEUE:")
+        for status, count in counts.items():
+            print(f"   {status.title()}: {count}")
+    
+    # Check embeddings (--stream indexes cases while extraction runs)
     embeddings_dir = "data/embeddings"
+    indexed = 0
     if os.path.exists(embeddings_dir) and os.path.exists(f"{embeddings_dir}/patient_cases.index"):
-        print(f"\n EMBEDDINGS: Created")
+        status = index_status(embeddings_dir)
+        indexed = status.get('vector_count', 0)
+        if status['ready']:
+            print(f"\n EMBEDDINGS: {indexed} cases indexed")
+            print(f"   Built: {status['built_at']} ({status['model']}, {status['index_type']})")
+        else:
+            print(f"\n EMBEDDINGS: Not ready")
+            for problem in status['problems']:
+                print(f"   Problem: {problem}")
+            print(f"   Action needed: Run 'python create_embeddings.py'")
+        if indexed < case_count:
+            print(f"   Not yet indexed: {case_count - indexed} processed cases")
     else:
         print(f"\n EMBEDDINGS: Not created yet")
         if case_count >= 4966:
@@ -72,10 +96,11 @@ def check_progress():
     
     # Next steps
     print("\n NEXT STEPS:")
-    if case_count < 100:
-        print("   Wait for processing to complete (check back in 30 mins)")
-    elif case_count < 4966:
+    if case_count < 4966:
         print("   Processing ongoing... Check back later")
+        if indexed < case_count:
+            print("   To search cases as they finish instead of after all 4,966:")
+            print("   Run: python process_cases_ollama.py --stream")
     elif not os.path.exists(f"{embeddings_dir}/patient_cases.index"):
         print("   Run: python create_embeddings.py")
     else:
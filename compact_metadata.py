@@ -0,0 +1,67 @@
+"""
+Compact Case Metadata
+One JSON record per line plus an offsets array, read through mmap so
+forked workers share the pages instead of each holding Python dicts
+"""
+
+import json
+import mmap
+import os
+
+import numpy as np
+
+METADATA_LINES = "metadata.jsonl"
+METADATA_OFFSETS = "metadata.offsets.npy"
+
+
+def write_compact_metadata(metadata, output_dir):
+    """Write metadata.jsonl and its offsets next to the index"""
+    offsets = []
+    lines_path = os.path.join(output_dir, METADATA_LINES)
+    with open(f"{lines_path}.tmp", 'wb') as f:
+        for record in metadata:
+            offsets.append(f.tell())
+            f.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+        offsets.append(f.tell())
+
+    offsets_path = os.path.join(output_dir, METADATA_OFFSETS)
+    with open(f"{offsets_path}.tmp", 'wb') as f:
+        np.save(f, np.array(offsets, dtype='int64'))
+
+    os.replace(f"{lines_path}.tmp", lines_path)
+    os.replace(f"{offsets_path}.tmp", offsets_path)
+    return lines_path
+
+
+class CompactMetadata:
+    """Read-only sequence of metadata records backed by mmap"""
+
+    def __init__(self, directory):
+        self.offsets = np.load(os.path.join(directory, METADATA_OFFSETS), mmap_mode='r')
+        self._file = open(os.path.join(directory, METADATA_LINES), 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def exists(cls, directory):
+        return (os.path.exists(os.path.join(directory, METADATA_LINES))
+                and os.path.exists(os.path.join(directory, METADATA_OFFSETS)))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return json.loads(self._mmap[start:end])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
@@ -6,24 +6,46 @@ Uses sentence-transformers (runs locally, FREE)
 from sentence_transformers import SentenceTransformer
 import os
 import json
+import time
 import numpy as np
 from tqdm import tqdm
-import faiss
+from lexical_index import LexicalIndex, case_lexical_text
+from sharded_index import remove_shards, write_shards
+from pipeline_profiler import add_profile_argument, profile_run
+from thread_budget import ThreadBudget, add_thread_arguments
+from index_snapshots import KEEP_SNAPSHOTS, link_files, publish_snapshot
+from index_manifest import read_manifest
+from index_files import (
+    EMBEDDING_MODEL, MIN_TEXT_LENGTH, case_embedding_text, case_metadata_record, write_index_files
+)
 
 def create_embeddings(
     processed_dir="data/processed/cases",
-    output_dir="data/embeddings"
+    output_dir="data/embeddings",
+    num_shards=1,
+    thread_budget=None,
+    keep_snapshots=KEEP_SNAPSHOTS
 ):
-    """Create embeddings for all processed cases"""
+    """Create embeddings for all processed cases
+    
+    num_shards > 1 additionally writes output_dir/shards/ for
+    scatter-gather search with sharded_index.ShardedCaseIndex.
+    thread_budget defaults to ThreadBudget.from_env().
+    keep_snapshots is how many snapshots stay in output_dir/snapshots/.
+    """
     
     print("\n" + "=" * 70)
     print("CREATING EMBEDDINGS FOR RAG SYSTEM")
     print("=" * 70)
     
+    thread_budget = thread_budget or ThreadBudget.from_env()
+    thread_budget.apply()
+    print(f"\n Thread budget: {thread_budget.describe()}")
+    
     # Load model
     print("\n Loading sentence-transformer model...")
     print("(First time: downloads ~400MB)")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = SentenceTransformer(EMBEDDING_MODEL)
     print(" Model loaded (384-dimensional embeddings)")
     
     # Get processed files
@@ -46,54 +68,26 @@ def create_embeddings(
     # Create embeddings
     embeddings = []
     metadata = []
+    lexical_index = LexicalIndex()
     
+    build_start = time.time()
     print("\n Creating embeddings (FREE, runs locally)...")
     for filename in tqdm(json_files, desc="Encoding"):
         try:
             with open(os.path.join(processed_dir, filename), 'r') as f:
                 case = json.load(f)
             
-            # Build text representation
-            text_parts = []
-            
-            # Add clinical information
-            if case.get('clinical_information'):
-                clin = case['clinical_information']
-                if clin.get('diagnosis'):
-                    text_parts.append(f"Diagnosis: {clin['diagnosis']}")
-                if clin.get('symptoms'):
-                    text_parts.append(f"Symptoms: {clin['symptoms']}")
-                if clin.get('physical_exam_findings'):
-                    text_parts.append(f"Findings: {clin['physical_exam_findings']}")
-            
-            # Add treatment info
-            if case.get('treatment'):
-                treat = case['treatment']
-                if treat.get('procedure_performed'):
-                    text_parts.append(f"Procedure: {treat['procedure_performed']}")
-                if treat.get('procedure_planned'):
-                    text_parts.append(f"Planned: {treat['procedure_planned']}")
-            
-            # Add specialty
-            if case.get('meta', {}).get('original_specialty'):
-                text_parts.append(f"Specialty: {case['meta']['original_specialty']}")
+            text = case_embedding_text(case)
             
-            text = " ".join(text_parts)
-            
-            if len(text) < 20:
+            if len(text) < MIN_TEXT_LENGTH:
                 continue
             
             # Generate embedding
             embedding = model.encode(text, normalize_embeddings=True)
             
             embeddings.append(embedding)
-            metadata.append({
-                'case_id': case.get('meta', {}).get('case_id'),
-                'diagnosis': case.get('clinical_information', {}).get('diagnosis'),
-                'procedure': case.get('treatment', {}).get('procedure_performed') or case.get('treatment', {}).get('procedure_planned'),
-                'specialty': case.get('meta', {}).get('original_specialty'),
-                'filename': filename
-            })
+            metadata.append(case_metadata_record(case, filename))
+            lexical_index.add(case_lexical_text(case))
             
         except Exception as e:
             print(f"\n Error with {filename}: {e}")
@@ -112,27 +106,30 @@ def create_embeddings(
     
     # Create FAISS index
     print("\n Building FAISS index...")
-    dimension = embeddings_array.shape[1]
-    
-    # Use IndexFlatIP for cosine similarity (since embeddings are normalized)
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings_array)
-    
-    # Save index
-    index_path = os.path.join(output_dir, "patient_cases.index")
-    faiss.write_index(index, index_path)
-    print(f" FAISS index saved: {index_path}")
-    
-    # Save embeddings as numpy array
-    embeddings_path = os.path.join(output_dir, "embeddings.npy")
-    np.save(embeddings_path, embeddings_array)
-    print(f" Embeddings saved: {embeddings_path}")
-    
-    # Save metadata
-    metadata_path = os.path.join(output_dir, "metadata.json")
-    with open(metadata_path, 'w') as f:
-        json.dump(metadata, f, indent=2)
-    print(f" Metadata saved: {metadata_path}")
+    build_seconds = round(time.time() - build_start, 1)
+    paths = write_index_files(output_dir, embeddings_array, metadata, lexical_index, build_seconds=build_seconds)
+    print(f" FAISS index saved: {paths['index']}")
+    print(f" Embeddings saved: {paths['embeddings']}")
+    print(f" Metadata saved: {paths['metadata']}")
+    print(f" Compact metadata saved: {paths['compact']}")
+    print(f" Lexical index saved: {paths['lexical']} ({len(lexical_index.postings)} terms)")
+    print(f" Manifest saved: {paths['manifest']}")
+    
+    # Versioned copy that running systems pick up without a restart
+    # (hard links to the files just written, not a second copy)
+    version = publish_snapshot(link_files(output_dir), root=os.path.join(output_dir, "snapshots"),
+                               keep=keep_snapshots)
+    print(f" Snapshot published: {output_dir}/snapshots/{version}")
+    
+    shard_root = os.path.join(output_dir, "shards")
+    if num_shards > 1:
+        source = read_manifest(output_dir)
+        shards = write_shards(embeddings_array, metadata, shard_root, num_shards, model_name=EMBEDDING_MODEL,
+                              source_sha256=source['files']['embeddings.npy']['sha256'])
+        print(f" Shards saved: {shard_root}/ ({len(shards)} shards)")
+    elif remove_shards(shard_root):
+        # Shards of the previous build would keep serving the old cases
+        print(f" Removed stale shards: {shard_root}/")
     
     print("\n" + "=" * 70)
     print("EMBEDDING CREATION COMPLETE")
@@ -142,4 +139,14 @@ def create_embeddings(
     print(f" Search ready: <10ms per query")
 
 if __name__ == "__main__":
-    create_embeddings()
+    import argparse
+    parser = argparse.ArgumentParser(description="Create embeddings for RAG system")
+    parser.add_argument('--shards', type=int, default=1, help="Also write N index shards")
+    parser.add_argument('--keep-snapshots', type=int, default=KEEP_SNAPSHOTS,
+                        help="Snapshots to keep in data/embeddings/snapshots/")
+    add_thread_arguments(parser)
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    with profile_run('create_embeddings', args.profile):
+        create_embeddings(num_shards=args.shards, thread_budget=ThreadBudget.from_args(args),
+                          keep_snapshots=args.keep_snapshots)
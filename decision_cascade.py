@@ -0,0 +1,132 @@
+"""
+Decision Model Cascade
+Run a fast model first and escalate to a larger one only when its
+answer is not confident or not self-consistent
+"""
+
+import os
+
+from ollama_pool import get_pool
+from schemas import DECISION_SCHEMA, DECISION_NUM_PREDICT, parse_decision, generation_stats
+
+DEFAULT_DECISION_MODEL = 'llama3.2'
+
+
+def parse_cascade_spec(spec):
+    """'llama3.2:1b,llama3.2' -> tiers; every tier but the last needs HIGH confidence"""
+    models = [m.strip() for m in spec.split(',') if m.strip()]
+    return [{'model': model, 'accept_confidence': ['HIGH']} for model in models]
+
+
+def default_cascade():
+    """Tiers from DECISION_CASCADE, else the single default model"""
+    spec = os.getenv('DECISION_CASCADE')
+    if spec:
+        return parse_cascade_spec(spec)
+    return [{'model': DEFAULT_DECISION_MODEL}]
+
+
+def decision_payload(prompt):
+    """/api/generate body (without 'model') for a decision prompt"""
+    return {
+        'prompt': prompt,
+        'stream': False,
+        'format': DECISION_SCHEMA,
+        'options': {'num_predict': DECISION_NUM_PREDICT}
+    }
+
+
+def parse_decision_response(body):
+    """Validate the decision in an Ollama generate body; returns a dict"""
+    return parse_decision(body['response']).model_dump()
+
+
+def decision_is_consistent(decision):
+    """Check that the decision agrees with its own criteria evaluation"""
+    statuses = [str(c.get('status', '')).upper() for c in decision.get('criteria_met') or []]
+    verdict = decision.get('decision')
+
+    if verdict == 'APPROVED':
+        return bool(statuses) and all(status == 'MET' for status in statuses)
+    if verdict == 'DENIED':
+        return 'NOT_MET' in statuses
+    if verdict == 'ADDITIONAL_INFO_NEEDED':
+        return bool(decision.get('missing_documentation'))
+    return False
+
+
+def escalation_reason(decision, tier):
+    """Why a tier's decision cannot be accepted (None if it can)"""
+    accepted = tier.get('accept_confidence', ['HIGH'])
+    if decision.get('confidence') not in accepted:
+        return f"confidence {decision.get('confidence')}"
+    if not decision_is_consistent(decision):
+        return "criteria inconsistent with decision"
+    return None
+
+
+def _tier_outcome(tier_index, tiers, body, escalations):
+    """Accept a tier's reply (returns the decision) or record an escalation (returns None)"""
+    tier = tiers[tier_index]
+    last_tier = tier_index == len(tiers) - 1
+    decision = parse_decision_response(body)
+
+    reason = None if last_tier else escalation_reason(decision, tier)
+    if reason:
+        escalations.append({
+            'model': tier['model'],
+            'decision': decision.get('decision'),
+            'reason': reason
+        })
+        return None
+
+    decision['decided_by'] = {
+        'tier': tier_index,
+        'model': tier['model'],
+        'escalations': escalations,
+        'generation': generation_stats(body)
+    }
+    return decision
+
+
+def run_decision_cascade(payload, tiers=None, pool=None, timeout=120):
+    """Generate a decision, escalating through tiers as needed
+
+    payload is the /api/generate body without 'model'. The returned
+    decision carries 'decided_by' with the deciding tier and any
+    escalations. Raises if the last tier fails.
+    """
+    tiers = tiers or default_cascade()
+    pool = pool or get_pool()
+    escalations = []
+
+    for tier_index, tier in enumerate(tiers):
+        try:
+            body = pool.generate(dict(payload, model=tier['model']), timeout=timeout)
+            decision = _tier_outcome(tier_index, tiers, body, escalations)
+        except Exception as e:
+            if tier_index == len(tiers) - 1:
+                raise
+            escalations.append({'model': tier['model'], 'reason': f"error: {e}"})
+            continue
+        if decision is not None:
+            return decision
+
+
+async def arun_decision_cascade(payload, tiers=None, pool=None, timeout=120):
+    """Async run_decision_cascade() using the pool's async HTTP client"""
+    tiers = tiers or default_cascade()
+    pool = pool or get_pool()
+    escalations = []
+
+    for tier_index, tier in enumerate(tiers):
+        try:
+            body = await pool.agenerate(dict(payload, model=tier['model']), timeout=timeout)
+            decision = _tier_outcome(tier_index, tiers, body, escalations)
+        except Exception as e:
+            if tier_index == len(tiers) - 1:
+                raise
+            escalations.append({'model': tier['model'], 'reason': f"error: {e}"})
+            continue
+        if decision is not None:
+            return decision
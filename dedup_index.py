@@ -0,0 +1,223 @@
+"""
+Near-Duplicate Case Pruning
+Clusters cases whose embeddings are almost identical (batched all-vs-all
+FAISS range search) and writes an index with one exemplar per cluster,
+so top-k results aren't k copies of the same case
+"""
+
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from index_files import EMBEDDING_MODEL, write_index_files
+from index_manifest import check_loaded, verify_directory
+from index_snapshots import link_files, publish_snapshot
+from lexical_index import LexicalIndex
+from thread_budget import ThreadBudget, add_thread_arguments
+
+EMBEDDINGS_DIR = "data/embeddings"
+DEDUP_DIR = "data/embeddings/dedup"
+CLUSTERS_FILE = "clusters.json"
+DEFAULT_THRESHOLD = 0.97
+
+
+def near_duplicate_clusters(vectors, threshold=DEFAULT_THRESHOLD, batch_size=1024):
+    """Greedy leader clustering; returns (clusters, exemplar_of)
+
+    clusters is [(exemplar_row, member_rows, member_similarities)] with the
+    exemplar first in its own members. Rows are visited in order: an
+    unassigned row becomes an exemplar and claims every unassigned row with
+    similarity >= threshold to it, so every member is a near-duplicate of
+    its exemplar (no chaining through intermediate cases). Only rows still
+    unassigned are range-searched, so heavily duplicated corpora get cheaper.
+    """
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    exemplar_of = np.full(len(vectors), -1, dtype='int64')
+    clusters = []
+
+    for start in range(0, len(vectors), batch_size):
+        pending = np.flatnonzero(exemplar_of[start:start + batch_size] < 0) + start
+        if not len(pending):
+            continue
+        lims, sims, ids = index.range_search(vectors[pending], threshold)
+        for i, row in enumerate(pending):
+            # Claimed by an earlier exemplar in this batch
+            if exemplar_of[row] >= 0:
+                continue
+            neighbors, neighbor_sims = ids[lims[i]:lims[i + 1]], sims[lims[i]:lims[i + 1]]
+            free = (exemplar_of[neighbors] < 0) & (neighbors != row)
+            members = np.concatenate([[row], neighbors[free]])
+            member_sims = np.concatenate([[1.0], neighbor_sims[free]])
+            exemplar_of[members] = row
+            clusters.append((int(row), members, member_sims))
+
+    return clusters, exemplar_of
+
+
+def load_index_directory(directory):
+    """(vectors, metadata, lexical_index, manifest) from create_embeddings' layout"""
+    manifest = verify_directory(directory)
+    vectors = np.load(os.path.join(directory, "embeddings.npy")).astype('float32')
+    with open(os.path.join(directory, "metadata.json"), 'r') as f:
+        metadata = json.load(f)
+    lexical_path = os.path.join(directory, "lexical_index.json")
+    lexical_index = LexicalIndex.load(lexical_path) if os.path.exists(lexical_path) else None
+
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    check_loaded(index, metadata, lexical_index, manifest=manifest)
+    return vectors, metadata, lexical_index, manifest
+
+
+def prune_near_duplicates(vectors, metadata, lexical_index, threshold=DEFAULT_THRESHOLD, batch_size=1024):
+    """Exemplar vectors, metadata, lexical index and the member mapping
+
+    Exemplar metadata records get cluster_size; the mapping lists every
+    member (case_id, source row, similarity to the exemplar) per exemplar.
+    """
+    clusters, exemplar_of = near_duplicate_clusters(vectors, threshold, batch_size)
+    rows = [row for row, _, _ in clusters]
+
+    pruned_metadata = []
+    mapping = []
+    for new_row, (row, members, member_sims) in enumerate(clusters):
+        pruned_metadata.append(dict(metadata[row], cluster_size=len(members)))
+        mapping.append({
+            'row': new_row,
+            'case_id': metadata[row]['case_id'],
+            'source_row': row,
+            'members': [
+                {'case_id': metadata[member]['case_id'], 'source_row': int(member), 'similarity': round(float(sim), 4)}
+                for member, sim in zip(members, member_sims)
+            ]
+        })
+
+    pruned_lexical = lexical_index.subset(rows) if lexical_index is not None else None
+    return vectors[rows], pruned_metadata, pruned_lexical, mapping, exemplar_of
+
+
+def write_pruned_index(output_dir, vectors, metadata, lexical_index, mapping, threshold,
+                       source_count, model_name=EMBEDDING_MODEL):
+    """Index files (same layout as create_embeddings) plus clusters.json"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = write_index_files(output_dir, vectors, metadata, lexical_index, model_name=model_name)
+
+    paths['clusters'] = os.path.join(output_dir, CLUSTERS_FILE)
+    with open(f"{paths['clusters']}.tmp", 'w') as f:
+        json.dump({
+            'threshold': threshold,
+            'source_vectors': source_count,
+            'exemplars': len(mapping),
+            'clusters': mapping
+        }, f)
+    os.replace(f"{paths['clusters']}.tmp", paths['clusters'])
+    return paths
+
+
+def measure_search(full_vectors, pruned_vectors, exemplar_of, num_queries=200, k=10, seed=0):
+    """Per-query latency and distinct clusters in top-k, full vs. pruned
+
+    Queries are corpus vectors with a little noise, i.e. look like cases.
+    """
+    rng = np.random.default_rng(seed)
+    queries = full_vectors[rng.integers(0, len(full_vectors), size=num_queries)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype('float32')
+    faiss.normalize_L2(queries)
+
+    results = {}
+    for name, vectors in (('full', full_vectors), ('pruned', pruned_vectors)):
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        top_k = min(k, index.ntotal)
+        index.search(queries[:1], top_k)
+        ids = []
+        start = time.perf_counter()
+        for query in queries:
+            ids.append(index.search(query[None, :], top_k)[1][0])
+        elapsed = time.perf_counter() - start
+        results[name] = {'ms_per_query': elapsed / num_queries * 1000, 'ids': np.array(ids)}
+
+    full_ids = results['full']['ids']
+    results['full']['distinct'] = float(np.mean([len(set(exemplar_of[row].tolist())) for row in full_ids]))
+    results['pruned']['distinct'] = float(results['pruned']['ids'].shape[1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune near-duplicate cases from the case index")
+    parser.add_argument('--source', default=EMBEDDINGS_DIR, help="Directory written by create_embeddings.py")
+    parser.add_argument('--output', default=DEDUP_DIR)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Cosine similarity at or above which cases are near-duplicates")
+    parser.add_argument('--batch-size', type=int, default=1024, help="Range-search query batch")
+    parser.add_argument('--queries', type=int, default=200, help="Queries for the speedup report (0 = skip)")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--publish', action='store_true',
+                        help="Publish the pruned index as the CURRENT snapshot for running systems")
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+
+    ThreadBudget.from_args(args).apply()
+
+    print("\n" + "=" * 70)
+    print("NEAR-DUPLICATE PRUNING")
+    print("=" * 70)
+
+    if not os.path.exists(os.path.join(args.source, "embeddings.npy")):
+        print(f" No embeddings in {args.source}")
+        print("   Run create_embeddings.py first!")
+        return
+
+    vectors, metadata, lexical_index, manifest = load_index_directory(args.source)
+    if lexical_index is None:
+        print(f" No lexical_index.json in {args.source}")
+        print("   Re-run create_embeddings.py first!")
+        return
+    model_name = (manifest or {}).get('model') or EMBEDDING_MODEL
+    print(f"\n Loaded {len(vectors)} cases from {args.source}/")
+
+    start = time.perf_counter()
+    pruned_vectors, pruned_metadata, pruned_lexical, mapping, exemplar_of = prune_near_duplicates(
+        vectors, metadata, lexical_index, args.threshold, args.batch_size
+    )
+    cluster_seconds = time.perf_counter() - start
+
+    sizes = [len(cluster['members']) for cluster in mapping]
+    print(f" Clustered in {cluster_seconds:.1f}s (threshold {args.threshold})")
+    print(f"   Exemplars: {len(pruned_vectors)} ({len(vectors) - len(pruned_vectors)} near-duplicates removed)")
+    print(f"   Clusters with duplicates: {sum(size > 1 for size in sizes)}, largest: {max(sizes)}")
+
+    paths = write_pruned_index(args.output, pruned_vectors, pruned_metadata, pruned_lexical, mapping,
+                               args.threshold, len(vectors), model_name)
+    print(f"\n Pruned index saved: {paths['index']}")
+    print(f" Member mapping saved: {paths['clusters']}")
+
+    if args.publish:
+        version = publish_snapshot(link_files(args.output), root=os.path.join(args.source, "snapshots"))
+        print(f" Snapshot published: {args.source}/snapshots/{version}")
+
+    print("\n" + "-" * 70)
+    print(f"{'':<24} {'Full':>14} {'Pruned':>14} {'Change':>14}")
+    print("-" * 70)
+    print(f"{'Vectors':<24} {len(vectors):>14} {len(pruned_vectors):>14} "
+          f"{len(pruned_vectors) / len(vectors) - 1:>13.1%}")
+    print(f"{'Index size (MB)':<24} {vectors.nbytes / 1e6:>14.1f} {pruned_vectors.nbytes / 1e6:>14.1f} "
+          f"{pruned_vectors.nbytes / vectors.nbytes - 1:>13.1%}")
+
+    if args.queries:
+        search = measure_search(vectors, pruned_vectors, exemplar_of, args.queries, args.k)
+        full, pruned = search['full'], search['pruned']
+        print(f"{'Search (ms/query)':<24} {full['ms_per_query']:>14.3f} {pruned['ms_per_query']:>14.3f} "
+              f"{full['ms_per_query'] / pruned['ms_per_query']:>12.2f}x")
+        print(f"{f'Distinct in top-{args.k}':<24} {full['distinct']:>14.1f} {pruned['distinct']:>14.1f}")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
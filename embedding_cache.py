@@ -0,0 +1,129 @@
+"""
+Query Embedding Cache
+LRU cache of query embeddings keyed by a hash of the normalized text
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query_text(text):
+    """Normalize text so trivially different resubmissions share a key"""
+    return re.sub(r'\s+', ' ', str(text)).strip().lower()
+
+
+def query_cache_key(text):
+    """Hash of the normalized query text"""
+    return hashlib.sha256(normalize_query_text(text).encode('utf-8')).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings, optionally persisted to disk"""
+
+    def __init__(self, model_name, max_entries=1024, path=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text):
+        """Return the cached embedding for text, or None"""
+        key = query_cache_key(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, text, embedding):
+        """Store an embedding, evicting the least recently used entry"""
+        key = query_cache_key(text)
+        embedding = np.asarray(embedding, dtype='float32')
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_encode(self, text, encode):
+        """Return the cached embedding or compute it with encode(text)"""
+        embedding = self.get(text)
+        if embedding is None:
+            embedding = encode(text)
+            self.put(text, embedding)
+        return embedding
+
+    def invalidate(self, model_name=None):
+        """Drop all entries (e.g. after the embedding model changed)"""
+        with self._lock:
+            self._entries.clear()
+            if model_name:
+                self.model_name = model_name
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            'model_name': self.model_name,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def save(self, path=None):
+        """Persist entries to an .npz file (written atomically)"""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = list(self._entries.values())
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                model_name=np.array(self.model_name),
+                keys=np.array(keys, dtype='U64'),
+                vectors=np.array(vectors, dtype='float32')
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Load persisted entries; ignored if they came from another model"""
+        path = path or self.path
+        try:
+            with np.load(path) as data:
+                if str(data['model_name']) != self.model_name:
+                    print(f" Query cache built with {data['model_name']}, discarding")
+                    return
+                keys = list(data['keys'])
+                vectors = data['vectors']
+        except Exception as e:
+            print(f" Could not load query cache {path}: {e}")
+            return
+
+        with self._lock:
+            self._entries.clear()
+            for key, vector in zip(keys[-self.max_entries:], vectors[-self.max_entries:]):
+                self._entries[str(key)] = vector
@@ -2,10 +2,21 @@
 Generate Insurance Policies with Ollama (UNLIMITED, FREE)
 """
 
-import requests
+import csv
+import hashlib
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import time
+from ollama_pool import get_pool
+from pipeline_profiler import add_profile_argument, profile_run
+
+POLICY_DIR = "data/processed/policies"
+POLICY_MODEL = 'llama3.2'
+BUILD_STATE_FILE = ".build_state.json"
+BUILD_REPORT_PATH = "data/policy_build_report.json"
 
 PROCEDURES = [
     ("Lumbar Discectomy", "63030"),
@@ -60,10 +71,13 @@ PROCEDURES = [
     ("Breast Biopsy", "19083"),
 ]
 
-def generate_policy_ollama(procedure_name, cpt_code):
-    """Generate policy using Ollama"""
-    
-    prompt = f"""Generate a detailed, realistic insurance prior authorization policy.
+def policy_safe_name(procedure_name):
+    """File stem for a procedure's policy"""
+    return procedure_name.lower().replace(' ', '_').replace('/', '_')
+
+def build_policy_prompt(procedure_name, cpt_code):
+    """Prompt that generates one policy"""
+    return f"""Generate a detailed, realistic insurance prior authorization policy.
 
 PROCEDURE: {procedure_name}
 CPT CODE: {cpt_code}
@@ -106,29 +120,45 @@ Create a comprehensive policy document including:
 Make it detailed and realistic like actual Blue Cross Blue Shield policies.
 Use specific numbers and durations."""
 
+def policy_hash(prompt, model):
+    """Changes whenever the prompt or the model that answers it changes"""
+    return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+def request_policy(prompt, model=POLICY_MODEL):
+    """Policy text from Ollama; raises on failure"""
+    body = get_pool().generate(
+        {
+            'model': model,
+            'prompt': prompt,
+            'stream': False
+        },
+        timeout=120
+    )
+    return body['response']
+
+def generate_policy_ollama(procedure_name, cpt_code):
+    """Generate policy using Ollama"""
     try:
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                'model': 'llama3.2',
-                'prompt': prompt,
-                'stream': False
-            },
-            timeout=120
-        )
-        
-        if response.status_code == 200:
-            return response.json()['response']
-        else:
-            print(f"Error: Status {response.status_code}")
-            return None
-            
+        return request_policy(build_policy_prompt(procedure_name, cpt_code))
     except Exception as e:
         print(f"Error: {e}")
         return None
 
+def write_policy(output_dir, safe_name, proc_name, cpt_code, policy):
+    """Write a policy file atomically (the decision system never reads a partial policy)"""
+    filepath = os.path.join(output_dir, f"{safe_name}_policy.txt")
+    with open(f"{filepath}.tmp", 'w') as f:
+        f.write(f"PRIOR AUTHORIZATION POLICY\n")
+        f.write(f"=" * 70 + "\n\n")
+        f.write(f"Procedure: {proc_name}\n")
+        f.write(f"CPT Code: {cpt_code}\n\n")
+        f.write("=" * 70 + "\n\n")
+        f.write(policy)
+    os.replace(f"{filepath}.tmp", filepath)
+    return filepath
+
 def main():
-    output_dir = "data/processed/policies"
+    output_dir = POLICY_DIR
     os.makedirs(output_dir, exist_ok=True)
     
     print("\n" + "=" * 70)
@@ -140,7 +170,7 @@ def main():
     
     todo = []
     for proc, cpt in PROCEDURES:
-        safe_name = proc.lower().replace(' ', '_').replace('/', '_')
+        safe_name = policy_safe_name(proc)
         if safe_name not in existing:
             todo.append((proc, cpt, safe_name))
     
@@ -171,15 +201,7 @@ def main():
             policy = generate_policy_ollama(proc_name, cpt_code)
             
             if policy:
-                filepath = os.path.join(output_dir, f"{safe_name}_policy.txt")
-                with open(filepath, 'w') as f:
-                    f.write(f"PRIOR AUTHORIZATION POLICY\n")
-                    f.write(f"=" * 70 + "\n\n")
-                    f.write(f"Procedure: {proc_name}\n")
-                    f.write(f"CPT Code: {cpt_code}\n\n")
-                    f.write("=" * 70 + "\n\n")
-                    f.write(policy)
-                
+                write_policy(output_dir, safe_name, proc_name, cpt_code, policy)
                 generated += 1
             else:
                 errors += 1
@@ -196,8 +218,195 @@ def main():
     print("=" * 70)
     print(f" Generated: {generated} policies")
     print(f" Errors: {errors}")
-    print(f" Total policies: {len(os.listdir(output_dir))}")
+    print(f" Total policies: {len([f for f in os.listdir(output_dir) if f.endswith('.txt')])}")
     print(f" Cost: $0")
 
+def load_procedures(path):
+    """[(procedure, cpt_code)] from a CSV/TSV file
+
+    Two columns, procedure name then CPT code; a header row is skipped if
+    present. Blank lines and lines starting with # are ignored.
+    """
+    with open(path, 'r', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = '\t' if '\t' in sample else ','
+        procedures = []
+        for row in csv.reader(f, delimiter=delimiter):
+            if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"{path}: expected 'procedure,cpt_code', got {row}")
+            name, code = row[0].strip(), row[1].strip()
+            if not procedures and name.lower() in ('procedure', 'procedure_name', 'name'):
+                continue
+            procedures.append((name, code))
+    return procedures
+
+def load_build_state(output_dir):
+    """{safe_name: {'hash', 'cpt_code', 'model', 'generated_at'}} from the last builds"""
+    try:
+        with open(os.path.join(output_dir, BUILD_STATE_FILE), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_build_state(output_dir, state):
+    path = os.path.join(output_dir, BUILD_STATE_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+def build_policies(procedures, output_dir=POLICY_DIR, model=POLICY_MODEL, concurrency=4,
+                   force=False, report_path=BUILD_REPORT_PATH):
+    """Generate policies without prompting; returns the build report
+
+    Requests run concurrency at a time through the Ollama pool (spread it
+    over hosts with OLLAMA_HOSTS). A policy whose prompt/model hash matches
+    the last successful build and whose file still exists is skipped. Build
+    state is saved after every policy, so an interrupted build resumes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_build_state(output_dir)
+    state_lock = threading.Lock()
+    
+    entries = []
+    seen = set()
+    duplicates = 0
+    for proc_name, cpt_code in procedures:
+        safe_name = policy_safe_name(proc_name)
+        if safe_name in seen:
+            duplicates += 1
+            continue
+        seen.add(safe_name)
+        prompt = build_policy_prompt(proc_name, cpt_code)
+        entries.append({
+            'procedure': proc_name,
+            'cpt_code': cpt_code,
+            'file': f"{safe_name}_policy.txt",
+            'safe_name': safe_name,
+            'prompt': prompt,
+            'hash': policy_hash(prompt, model)
+        })
+    
+    todo = []
+    results = []
+    for entry in entries:
+        unchanged = (
+            state.get(entry['safe_name'], {}).get('hash') == entry['hash']
+            and os.path.exists(os.path.join(output_dir, entry['file']))
+        )
+        if unchanged and not force:
+            results.append({'procedure': entry['procedure'], 'cpt_code': entry['cpt_code'],
+                            'file': entry['file'], 'status': 'skipped'})
+        else:
+            todo.append(entry)
+    
+    print(f"\n BUILD PLAN")
+    print("-" * 70)
+    print(f"Procedures: {len(entries)}" + (f" ({duplicates} duplicate names ignored)" if duplicates else ""))
+    print(f"Unchanged (skipped): {len(entries) - len(todo)}")
+    print(f"To generate: {len(todo)} with {model}, {concurrency} at a time")
+    
+    def generate(entry):
+        start = time.perf_counter()
+        result = {'procedure': entry['procedure'], 'cpt_code': entry['cpt_code'], 'file': entry['file']}
+        try:
+            policy = request_policy(entry['prompt'], model)
+            if not policy or not policy.strip():
+                raise ValueError("empty response")
+            write_policy(output_dir, entry['safe_name'], entry['procedure'], entry['cpt_code'], policy)
+        except Exception as e:
+            result.update(status='failed', error=str(e), latency=round(time.perf_counter() - start, 3))
+            return result
+        result.update(status='generated', latency=round(time.perf_counter() - start, 3))
+        with state_lock:
+            state[entry['safe_name']] = {
+                'hash': entry['hash'],
+                'cpt_code': entry['cpt_code'],
+                'model': model,
+                'generated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            save_build_state(output_dir, state)
+        return result
+    
+    build_start = time.perf_counter()
+    if todo:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(generate, entry) for entry in todo]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Generating"):
+                results.append(future.result())
+    wall_seconds = time.perf_counter() - build_start
+    
+    order = {entry['safe_name']: i for i, entry in enumerate(entries)}
+    results.sort(key=lambda r: order[policy_safe_name(r['procedure'])])
+    generated = [r for r in results if r['status'] == 'generated']
+    failed = [r for r in results if r['status'] == 'failed']
+    latencies = [r['latency'] for r in generated]
+    
+    report = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'model': model,
+        'concurrency': concurrency,
+        'output_directory': output_dir,
+        'procedures': len(entries),
+        'duplicates': duplicates,
+        'generated': len(generated),
+        'skipped': len(entries) - len(todo),
+        'failed': len(failed),
+        'wall_seconds': round(wall_seconds, 1),
+        'policies_per_minute': round(len(generated) / wall_seconds * 60, 1) if generated else 0.0,
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p95': percentile(latencies, 0.95),
+        'latency_max': max(latencies) if latencies else None,
+        'policies': results
+    }
+    if report_path:
+        with open(f"{report_path}.tmp", 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(f"{report_path}.tmp", report_path)
+    
+    print("\n" + "=" * 70)
+    print("POLICY BUILD COMPLETE")
+    print("=" * 70)
+    print(f" Generated: {report['generated']}  Skipped: {report['skipped']}  Failed: {report['failed']}")
+    print(f" Wall time: {wall_seconds:.1f}s ({report['policies_per_minute']} policies/min)")
+    if latencies:
+        print(f" Latency: p50 {report['latency_p50']:.1f}s, p95 {report['latency_p95']:.1f}s, "
+              f"max {report['latency_max']:.1f}s")
+    for result in failed[:10]:
+        print(f"   {result['procedure']} ({result['cpt_code']}): {result['error']}")
+    if len(failed) > 10:
+        print(f"   ... {len(failed) - 10} more failures in the report")
+    if report_path:
+        print(f"\n Report saved to: {report_path}")
+    return report
+
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate prior authorization policies with Ollama")
+    parser.add_argument('--build', action='store_true',
+                        help="Non-interactive build: concurrent, skips unchanged policies, writes a report")
+    parser.add_argument('--procedures', default=None,
+                        help="CSV/TSV of procedure,cpt_code for --build (default: built-in list)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Policies generated at once")
+    parser.add_argument('--model', default=POLICY_MODEL)
+    parser.add_argument('--force', action='store_true', help="Regenerate unchanged policies too")
+    parser.add_argument('--output-dir', default=POLICY_DIR)
+    parser.add_argument('--report', default=BUILD_REPORT_PATH)
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    
+    with profile_run('generate_policies_ollama', args.profile):
+        if args.build:
+            procedures = load_procedures(args.procedures) if args.procedures else PROCEDURES
+            build_policies(procedures, output_dir=args.output_dir, model=args.model,
+                           concurrency=args.concurrency, force=args.force, report_path=args.report)
+        else:
+            main()
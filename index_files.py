@@ -0,0 +1,102 @@
+"""
+Index Files
+Case text/metadata for the vector index and the on-disk index layout
+(FAISS index, vectors, metadata, lexical index, manifest), without the
+embedding model, so offline tools can write indexes with numpy and FAISS only
+"""
+
+import json
+import os
+
+import faiss
+import numpy as np
+
+from compact_metadata import METADATA_LINES, METADATA_OFFSETS, write_compact_metadata
+from index_manifest import write_manifest
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+MIN_TEXT_LENGTH = 20
+
+
+def case_embedding_text(case):
+    """Text that represents a processed case in the vector index"""
+    text_parts = []
+    
+    # Add clinical information
+    if case.get('clinical_information'):
+        clin = case['clinical_information']
+        if clin.get('diagnosis'):
+            text_parts.append(f"Diagnosis: {clin['diagnosis']}")
+        if clin.get('symptoms'):
+            text_parts.append(f"Symptoms: {clin['symptoms']}")
+        if clin.get('physical_exam_findings'):
+            text_parts.append(f"Findings: {clin['physical_exam_findings']}")
+    
+    # Add treatment info
+    if case.get('treatment'):
+        treat = case['treatment']
+        if treat.get('procedure_performed'):
+            text_parts.append(f"Procedure: {treat['procedure_performed']}")
+        if treat.get('procedure_planned'):
+            text_parts.append(f"Planned: {treat['procedure_planned']}")
+    
+    # Add specialty
+    if case.get('meta', {}).get('original_specialty'):
+        text_parts.append(f"Specialty: {case['meta']['original_specialty']}")
+    
+    return " ".join(text_parts)
+
+
+def case_metadata_record(case, filename):
+    """Metadata row stored alongside a case's vector"""
+    return {
+        'case_id': case.get('meta', {}).get('case_id'),
+        'diagnosis': case.get('clinical_information', {}).get('diagnosis'),
+        'procedure': case.get('treatment', {}).get('procedure_performed') or case.get('treatment', {}).get('procedure_planned'),
+        'specialty': case.get('meta', {}).get('original_specialty'),
+        'filename': filename
+    }
+
+
+def write_index_files(output_dir, embeddings_array, metadata, lexical_index, index=None,
+                      model_name=EMBEDDING_MODEL, build_seconds=None):
+    """Write index, vectors, metadata and lexical index; each file is replaced atomically
+    
+    manifest.json is written last, over the files as they ended up on disk.
+    """
+    if index is None:
+        # IndexFlatIP = cosine similarity (embeddings are normalized)
+        index = faiss.IndexFlatIP(embeddings_array.shape[1])
+        index.add(embeddings_array)
+    
+    paths = {
+        'index': os.path.join(output_dir, "patient_cases.index"),
+        'embeddings': os.path.join(output_dir, "embeddings.npy"),
+        'metadata': os.path.join(output_dir, "metadata.json"),
+        'lexical': os.path.join(output_dir, "lexical_index.json")
+    }
+    
+    faiss.write_index(index, f"{paths['index']}.tmp")
+    os.replace(f"{paths['index']}.tmp", paths['index'])
+    
+    with open(f"{paths['embeddings']}.tmp", 'wb') as f:
+        np.save(f, embeddings_array)
+    os.replace(f"{paths['embeddings']}.tmp", paths['embeddings'])
+    
+    with open(f"{paths['metadata']}.tmp", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(f"{paths['metadata']}.tmp", paths['metadata'])
+    
+    # Compact copy for memory-mapped, fork-shared serving (prefork_server.py)
+    paths['compact'] = write_compact_metadata(metadata, output_dir)
+    
+    # Lexical row ids match the FAISS index
+    lexical_index.save(paths['lexical'])
+    
+    files = [os.path.basename(paths[key]) for key in ('index', 'embeddings', 'metadata', 'lexical')]
+    write_manifest(
+        output_dir, index, len(metadata), files + [METADATA_LINES, METADATA_OFFSETS],
+        model_name, lexical_count=len(lexical_index), build_seconds=build_seconds
+    )
+    paths['manifest'] = os.path.join(output_dir, "manifest.json")
+    return paths
@@ -0,0 +1,140 @@
+"""
+Index Manifest
+manifest.json next to the index records vector count, dimension, model,
+index type, build time and per-file checksums, so readiness checks don't
+have to load the index and loaders can refuse mismatched artifacts
+"""
+
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class IndexIntegrityError(ValueError):
+    """Index artifacts are missing, corrupted or don't belong together"""
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_manifest(directory, index, metadata_count, files, model_name, lexical_count=None, build_seconds=None):
+    """Checksum `files` (names inside directory) and write manifest.json atomically"""
+    manifest = {
+        'manifest_version': MANIFEST_VERSION,
+        'vector_count': int(index.ntotal),
+        'dimension': int(index.d),
+        'index_type': type(index).__name__,
+        'metric': 'inner_product' if index.metric_type == 0 else 'l2',
+        'model': model_name,
+        'metadata_count': int(metadata_count),
+        'lexical_count': lexical_count,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'build_seconds': build_seconds,
+        'files': {
+            name: {
+                'bytes': os.path.getsize(os.path.join(directory, name)),
+                'sha256': file_checksum(os.path.join(directory, name))
+            }
+            for name in files
+        }
+    }
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+    return manifest
+
+
+def read_manifest(directory):
+    """Parsed manifest.json, or None if there isn't one"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def manifest_problems(directory, manifest, checksums=True):
+    """Ways the files on disk disagree with the manifest (empty list = OK)
+
+    checksums=False only compares file sizes, which is O(number of files).
+    """
+    problems = []
+    if manifest['vector_count'] != manifest['metadata_count']:
+        problems.append(f"{manifest['vector_count']} vectors but {manifest['metadata_count']} metadata records")
+    lexical_count = manifest.get('lexical_count')
+    if lexical_count is not None and lexical_count != manifest['vector_count']:
+        problems.append(f"{manifest['vector_count']} vectors but {lexical_count} lexical documents")
+
+    for name, expected in manifest['files'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            problems.append(f"{name} missing")
+        elif os.path.getsize(path) != expected['bytes']:
+            problems.append(f"{name} is {os.path.getsize(path)} bytes, manifest says {expected['bytes']}")
+        elif checksums and file_checksum(path) != expected['sha256']:
+            problems.append(f"{name} checksum mismatch")
+    return problems
+
+
+def index_status(directory):
+    """Readiness from the manifest alone (no index load, no hashing)"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return {'ready': False, 'problems': [f"no {MANIFEST_FILE} in {directory}"]}
+    problems = manifest_problems(directory, manifest, checksums=False)
+    return {
+        'ready': not problems,
+        'vector_count': manifest['vector_count'],
+        'dimension': manifest['dimension'],
+        'model': manifest['model'],
+        'index_type': manifest['index_type'],
+        'built_at': manifest['built_at'],
+        'problems': problems
+    }
+
+
+def verify_directory(directory, checksums=True):
+    """Raise IndexIntegrityError unless the files match their manifest
+
+    Directories without a manifest (built before manifests existed) pass;
+    check_loaded() still compares what was actually loaded.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    problems = manifest_problems(directory, manifest, checksums=checksums)
+    if problems:
+        raise IndexIntegrityError(f"{directory}: " + "; ".join(problems))
+    return manifest
+
+
+def check_loaded(index, metadata, lexical_index=None, manifest=None, model_name=None):
+    """Raise IndexIntegrityError if loaded artifacts don't line up
+
+    A FAISS row id is only meaningful if row i of the metadata (and
+    document i of the lexical index) describes the same case.
+    """
+    problems = []
+    if index.ntotal != len(metadata):
+        problems.append(f"index has {index.ntotal} vectors but metadata has {len(metadata)} records")
+    if lexical_index is not None and len(lexical_index) != index.ntotal:
+        problems.append(f"lexical index has {len(lexical_index)} documents, index has {index.ntotal}")
+    if manifest is not None:
+        if manifest['vector_count'] != index.ntotal:
+            problems.append(f"manifest says {manifest['vector_count']} vectors, index has {index.ntotal}")
+        if manifest['dimension'] != index.d:
+            problems.append(f"manifest says dimension {manifest['dimension']}, index has {index.d}")
+        if model_name and manifest['model'] != model_name:
+            problems.append(f"index built with {manifest['model']}, queries use {model_name}")
+    if problems:
+        raise IndexIntegrityError("; ".join(problems))
@@ -0,0 +1,238 @@
+"""
+Versioned Index Snapshots
+Builders write each index into its own directory and flip a CURRENT
+pointer atomically; running systems load new snapshots in the background
+and swap them in while searches on the old one finish
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import faiss
+
+from index_manifest import check_loaded, verify_directory
+from lexical_index import LexicalIndex
+
+SNAPSHOT_ROOT = "data/embeddings/snapshots"
+CURRENT_FILE = "CURRENT"
+KEEP_SNAPSHOTS = 3
+# Staging directories this old are left over from a builder that died
+STALE_STAGING_SECONDS = 3600
+
+
+def new_version():
+    """Sortable snapshot name, e.g. 20250101T120000-123456"""
+    now = time.time()
+    return time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f"-{int(now * 1e6) % 1000000:06d}"
+
+
+def current_version(root=SNAPSHOT_ROOT):
+    """Version named by CURRENT, or None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r') as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return version if version and os.path.isdir(os.path.join(root, version)) else None
+
+
+def publish_snapshot(write_files, root=SNAPSHOT_ROOT, keep=KEEP_SNAPSHOTS):
+    """Build a snapshot with write_files(directory), then make it CURRENT
+
+    Readers never see a partial snapshot: files are written into a hidden
+    directory that is renamed into place before CURRENT is replaced.
+    """
+    os.makedirs(root, exist_ok=True)
+    version = new_version()
+    staging = os.path.join(root, f".tmp-{version}")
+    os.makedirs(staging)
+    try:
+        write_files(staging)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, CURRENT_FILE)
+    with open(f"{pointer}.tmp", 'w') as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{pointer}.tmp", pointer)
+
+    prune_snapshots(root, keep)
+    return version
+
+
+def link_files(source_dir):
+    """write_files for publish_snapshot() that hard-links source_dir's files
+
+    For builders that have just written the same files at the top level:
+    the snapshot shares their disk blocks instead of writing everything a
+    second time. Files there are only ever replaced (os.replace), never
+    rewritten in place, so the snapshot's links keep their contents.
+    Falls back to copying across filesystems.
+    """
+    def write_files(directory):
+        for name in sorted(os.listdir(source_dir)):
+            path = os.path.join(source_dir, name)
+            if not os.path.isfile(path) or name.endswith('.tmp'):
+                continue
+            try:
+                os.link(path, os.path.join(directory, name))
+            except OSError:
+                shutil.copy2(path, os.path.join(directory, name))
+    return write_files
+
+
+def prune_snapshots(root=SNAPSHOT_ROOT, keep=KEEP_SNAPSHOTS):
+    """Delete all but the newest `keep` snapshots (never CURRENT)
+
+    Staging directories of builders that died mid-publish are deleted too
+    once they are STALE_STAGING_SECONDS old. Processes still serving a
+    deleted snapshot are unaffected: its files are already loaded (or
+    mapped, which keeps them alive until unmapped).
+    """
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith('.tmp-') and time.time() - os.path.getmtime(path) > STALE_STAGING_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+
+    current = current_version(root)
+    versions = sorted(
+        (name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)) and not name.startswith('.')),
+        reverse=True
+    )
+    for version in versions[keep:]:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+class IndexSnapshot:
+    """One loaded snapshot: FAISS index, metadata and lexical index
+
+    Searches hold a reference while they run; a retired snapshot frees its
+    index once the last reference is released.
+    """
+
+    def __init__(self, directory, model_name=None):
+        self.directory = directory
+        self.version = os.path.basename(os.path.normpath(directory))
+        self.manifest = verify_directory(directory)
+        self.case_index = faiss.read_index(os.path.join(directory, "patient_cases.index"))
+        with open(os.path.join(directory, "metadata.json"), 'r') as f:
+            self.case_metadata = json.load(f)
+        lexical_path = os.path.join(directory, "lexical_index.json")
+        self.lexical_index = LexicalIndex.load(lexical_path) if os.path.exists(lexical_path) else None
+        check_loaded(self.case_index, self.case_metadata, self.lexical_index,
+                     manifest=self.manifest, model_name=model_name)
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            drained = self._retired and self._refs == 0
+        if drained:
+            self._free()
+
+    def retire(self):
+        """No new searches will use this snapshot; free it once drained"""
+        with self._lock:
+            self._retired = True
+            drained = self._refs == 0
+        if drained:
+            self._free()
+
+    def _free(self):
+        self.case_index = None
+        self.case_metadata = None
+        self.lexical_index = None
+
+
+class SnapshotManager:
+    """Serve the CURRENT snapshot and hot-swap when it changes
+
+    acquire() pins the snapshot for one search. A watcher thread polls
+    CURRENT every poll_interval seconds; a new snapshot is loaded on that
+    thread, so searches never wait for a load, and a snapshot that fails to
+    load is skipped (the old one keeps serving).
+    """
+
+    def __init__(self, root=SNAPSHOT_ROOT, poll_interval=30, on_swap=None, model_name=None):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_swap = on_swap
+        self.model_name = model_name
+        self.swaps = 0
+        self._lock = threading.Lock()
+        self._failed_version = None
+        version = current_version(root)
+        if version is None:
+            raise FileNotFoundError(f"No CURRENT snapshot in {root}")
+        self.current = IndexSnapshot(os.path.join(root, version), model_name)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def available(cls, root=SNAPSHOT_ROOT):
+        return current_version(root) is not None
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            snapshot = self.current
+            snapshot.acquire()
+        try:
+            yield snapshot
+        finally:
+            snapshot.release()
+
+    def check_for_update(self):
+        """Load and swap in a newer CURRENT snapshot; True if swapped"""
+        version = current_version(self.root)
+        if version is None or version == self.current.version or version == self._failed_version:
+            return False
+        try:
+            snapshot = IndexSnapshot(os.path.join(self.root, version), self.model_name)
+        except Exception as e:
+            self._failed_version = version
+            print(f" Snapshot {version} failed to load, keeping {self.current.version}: {e}")
+            return False
+
+        with self._lock:
+            old, self.current = self.current, snapshot
+            self.swaps += 1
+        old.retire()
+        if self.on_swap:
+            self.on_swap(snapshot)
+        return True
+
+    def start(self):
+        """Watch CURRENT in a background thread"""
+        if self._thread is None and self.poll_interval:
+            self._thread = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                print(f" Snapshot watcher error: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,132 @@
+"""
+Lexical (BM25) Index over Case Metadata
+Cheap keyword candidate generation for diagnosis/procedure/specialty terms
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has',
+    'he', 'her', 'his', 'in', 'is', 'it', 'of', 'on', 'or', 'she', 'the',
+    'that', 'this', 'to', 'was', 'were', 'with', 'null', 'none', 'patient'
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens; keeps CPT codes and numbers"""
+    if not text:
+        return []
+    return [
+        tok for tok in TOKEN_PATTERN.findall(str(text).lower())
+        if tok not in STOPWORDS and (len(tok) > 1 or tok.isdigit())
+    ]
+
+
+def case_lexical_text(case):
+    """Fields of a processed case that go into the lexical index"""
+    clin = case.get('clinical_information') or {}
+    treat = case.get('treatment') or {}
+    meta = case.get('meta') or {}
+    parts = [
+        clin.get('diagnosis'),
+        treat.get('procedure_performed'),
+        treat.get('procedure_planned'),
+        meta.get('original_specialty'),
+        clin.get('symptoms')
+    ]
+    return " ".join(str(p) for p in parts if p and str(p).lower() != 'null')
+
+
+class LexicalIndex:
+    """Inverted index with BM25 scoring; document ids match FAISS row ids"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_lengths = []
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, text):
+        """Add the next document; returns its id"""
+        doc_id = len(self.doc_lengths)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings[term][doc_id] = tf
+        self.doc_lengths.append(len(tokens))
+        return doc_id
+
+    def search(self, query, k=50):
+        """Return [(doc_id, score)] for the top k BM25 matches"""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        avg_len = sum(self.doc_lengths) / n_docs or 1.0
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+    def subset(self, doc_ids):
+        """New index over doc_ids only, renumbered 0..len(doc_ids)-1 in that order"""
+        new_ids = {doc_id: new_id for new_id, doc_id in enumerate(doc_ids)}
+        index = LexicalIndex(k1=self.k1, b=self.b)
+        index.doc_lengths = [self.doc_lengths[doc_id] for doc_id in doc_ids]
+        for term, docs in self.postings.items():
+            kept = {new_ids[doc_id]: tf for doc_id, tf in docs.items() if doc_id in new_ids}
+            if kept:
+                index.postings[term] = kept
+        return index
+
+    def save(self, path):
+        """Write the index as JSON"""
+        data = {
+            'k1': self.k1,
+            'b': self.b,
+            'doc_lengths': self.doc_lengths,
+            'postings': {
+                term: [[doc_id, tf] for doc_id, tf in docs.items()]
+                for term, docs in self.postings.items()
+            }
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        index = cls(k1=data['k1'], b=data['b'])
+        index.doc_lengths = data['doc_lengths']
+        for term, docs in data['postings'].items():
+            index.postings[term] = {doc_id: tf for doc_id, tf in docs}
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked id lists; returns ids ordered by fused score"""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused, key=lambda doc_id: (-fused[doc_id], doc_id))
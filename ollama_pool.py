@@ -0,0 +1,334 @@
+"""
+Ollama Backend Pool
+Spread generate calls over several Ollama hosts with
+least-outstanding-requests routing, health checks and ejection
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_ENDPOINT = 'http://localhost:11434'
+
+
+class OllamaError(Exception):
+    """A generate call failed on every backend tried, or was rejected (4xx)"""
+
+
+def _outcome(status_code):
+    """True for 200, None for a 4xx (the request's fault, not the backend's), else False"""
+    if status_code == 200:
+        return True
+    if 400 <= status_code < 500:
+        return None
+    return False
+
+
+class Backend:
+    """One Ollama endpoint and its routing/health state"""
+
+    def __init__(self, url, window):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+        self.ejected_at = None
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.recent = deque(maxlen=window)
+        self.latencies = deque(maxlen=1000)
+
+    def error_rate(self):
+        if not self.recent:
+            return 0.0
+        return 1 - sum(self.recent) / len(self.recent)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'error_rate': self.error_rate(),
+            'latency_mean': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95)
+        }
+
+
+class OllamaPool:
+    """Route generate calls to the least-loaded healthy backend"""
+
+    def __init__(self, endpoints, max_consecutive_failures=3, error_rate_threshold=0.5,
+                 error_window=20, readmit_after=30, health_interval=10):
+        if isinstance(endpoints, str):
+            endpoints = [e for e in endpoints.split(',') if e.strip()]
+        self.backends = [Backend(url.strip(), error_window) for url in endpoints]
+        self.max_consecutive_failures = max_consecutive_failures
+        self.error_rate_threshold = error_rate_threshold
+        self.error_window = error_window
+        self.readmit_after = readmit_after
+        self.health_interval = health_interval
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+        self._next = 0
+        # One httpx.AsyncClient per event loop (see _get_async_client)
+        self._async_clients = {}
+
+    # --- Routing ----------------------------------------------------------
+
+    def _acquire(self, exclude=()):
+        """Pick the healthy backend with the fewest outstanding requests"""
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                # Everything ejected: try anything rather than fail outright
+                candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            # Rotate the start point so ties spread evenly
+            self._next = (self._next + 1) % len(candidates)
+            rotated = candidates[self._next:] + candidates[:self._next]
+            backend = min(rotated, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _release(self, backend, ok, latency=None):
+        """Give back a backend from _acquire(); ok=None (e.g. cancelled) records no outcome"""
+        with self._lock:
+            backend.outstanding -= 1
+            if ok is None:
+                return
+            backend.recent.append(1 if ok else 0)
+            if ok:
+                backend.consecutive_failures = 0
+                backend.latencies.append(latency)
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            too_many = backend.consecutive_failures >= self.max_consecutive_failures
+            too_often = (len(backend.recent) >= self.error_window
+                         and backend.error_rate() > self.error_rate_threshold)
+            if backend.healthy and (too_many or too_often):
+                self._eject(backend)
+
+    def _eject(self, backend):
+        backend.healthy = False
+        backend.ejected_at = time.time()
+        print(f" Ejected Ollama backend {backend.url}")
+
+    def _readmit(self, backend):
+        backend.healthy = True
+        backend.ejected_at = None
+        backend.consecutive_failures = 0
+        backend.recent.clear()
+        print(f" Re-admitted Ollama backend {backend.url}")
+
+    def generate(self, payload, timeout=120):
+        """POST payload to /api/generate; returns the decoded response body
+
+        Connection errors and 5xx responses count against the backend's
+        health and are retried once on each other backend before raising
+        OllamaError. A 4xx (e.g. model not pulled, bad payload) raises
+        OllamaError at once without touching backend health.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend = self._acquire(exclude=tried)
+            if backend is None:
+                raise OllamaError(last_error or "no Ollama backends configured")
+            tried.append(backend)
+
+            start = time.perf_counter()
+            ok = None
+            try:
+                response = self.session.post(f"{backend.url}/api/generate", json=payload, timeout=timeout)
+                ok = _outcome(response.status_code)
+            except requests.RequestException as e:
+                ok = False
+                last_error = f"{backend.url}: {e}"
+                continue
+            finally:
+                self._release(backend, ok, latency=time.perf_counter() - start)
+
+            if ok:
+                return response.json()
+            if ok is None:
+                raise OllamaError(f"{backend.url}: Status {response.status_code}: {response.text[:200]}")
+            last_error = f"{backend.url}: Status {response.status_code}"
+
+    def _get_async_client(self, max_connections=100):
+        """httpx.AsyncClient (connection pool) for the running event loop
+
+        A client is bound to the loop it first ran on, so every loop (e.g.
+        each asyncio.run()) gets its own; clients of closed loops are dropped.
+        """
+        if httpx is None:
+            raise OllamaError("httpx is required for async calls (pip install httpx)")
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for closed in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[closed]
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+                )
+                self._async_clients[loop] = client
+        return client
+
+    async def agenerate(self, payload, timeout=120):
+        """Async generate(): same routing, retries, 4xx handling and stats, no thread held"""
+        client = self._get_async_client()
+        tried = []
+        last_error = None
+        while True:
+            backend = self._acquire(exclude=tried)
+            if backend is None:
+                raise OllamaError(last_error or "no Ollama backends configured")
+            tried.append(backend)
+
+            start = time.perf_counter()
+            ok = None
+            try:
+                response = await client.post(f"{backend.url}/api/generate", json=payload, timeout=timeout)
+                ok = _outcome(response.status_code)
+            except httpx.HTTPError as e:
+                ok = False
+                last_error = f"{backend.url}: {e!r}"
+                continue
+            finally:
+                # Also on cancellation, so outstanding never leaks
+                self._release(backend, ok, latency=time.perf_counter() - start)
+
+            if ok:
+                return response.json()
+            if ok is None:
+                raise OllamaError(f"{backend.url}: Status {response.status_code}: {response.text[:200]}")
+            last_error = f"{backend.url}: Status {response.status_code}"
+
+    async def aclose(self):
+        """Close the running loop's async client (call before the loop ends)"""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # --- Health checks ----------------------------------------------------
+
+    def check_health(self, timeout=5):
+        """Probe every backend; eject dead ones and re-admit recovered ones"""
+        for backend in self.backends:
+            try:
+                ok = self.session.get(f"{backend.url}/api/tags", timeout=timeout).status_code == 200
+            except requests.RequestException:
+                ok = False
+
+            with self._lock:
+                if not ok and backend.healthy:
+                    self._eject(backend)
+                elif ok and not backend.healthy:
+                    if time.time() - backend.ejected_at >= self.readmit_after:
+                        self._readmit(backend)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def start_health_checks(self):
+        """Run check_health() in a background thread every health_interval"""
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._health_thread.start()
+
+    def close(self):
+        self._stop.set()
+        self.session.close()
+
+    def stats(self):
+        """Per-backend routing, error and latency stats"""
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared pool for OLLAMA_HOSTS (comma-separated), default localhost"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = OllamaPool(os.getenv('OLLAMA_HOSTS', DEFAULT_ENDPOINT))
+            if len(_default_pool.backends) > 1:
+                _default_pool.start_health_checks()
+        return _default_pool
+
+
+def main():
+    """Exercise the pool against local stub servers and print backend stats"""
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+    from ollama_stub import OllamaStub
+
+    parser = argparse.ArgumentParser(description="Run the Ollama pool against local stub servers")
+    parser.add_argument('--latencies', default="0.05,0.1,0.2", help="Per-stub latency in seconds")
+    parser.add_argument('--failing', type=int, default=1, help="Number of extra stubs that always fail")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    stubs = [OllamaStub(latency=float(lat)).start() for lat in args.latencies.split(',')]
+    stubs += [OllamaStub(fail_rate=1.0).start() for _ in range(args.failing)]
+    pool = OllamaPool([stub.url for stub in stubs], readmit_after=1, health_interval=1)
+    pool.start_health_checks()
+
+    def call(i):
+        try:
+            pool.generate({'model': 'stub', 'prompt': f"request {i}", 'stream': False}, timeout=10)
+            return True
+        except OllamaError:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        ok = sum(executor.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n {ok}/{args.requests} succeeded in {elapsed:.2f}s")
+    print(f"\n{'Backend':<28} {'Healthy':>8} {'Reqs':>6} {'Fails':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    print("-" * 70)
+    for s in pool.stats():
+        p50 = f"{s['latency_p50'] * 1000:.0f}" if s['latency_p50'] is not None else '-'
+        p95 = f"{s['latency_p95'] * 1000:.0f}" if s['latency_p95'] is not None else '-'
+        print(f"{s['url']:<28} {str(s['healthy']):>8} {s['requests']:>6} {s['failures']:>6} {p50:>8} {p95:>8}")
+
+    pool.close()
+    for stub in stubs:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
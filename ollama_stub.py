@@ -0,0 +1,139 @@
+"""
+Local Ollama Stub Server
+Minimal stand-in for the Ollama HTTP API used by tests and benchmarks
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_responder(payload):
+    """Return an empty JSON object for every prompt"""
+    return "{}"
+
+
+class OllamaStub:
+    """Serve /api/generate and /api/tags on a local port
+
+    responder(payload) returns the 'response' text (or a full response
+    dict); latency may be a number of seconds or a callable(payload).
+    """
+
+    def __init__(self, port=0, responder=default_responder, latency=0.0, fail_rate=0.0, seed=None):
+        self.responder = responder
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.healthy = True
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = _StubServer(('127.0.0.1', port), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def generate(self, payload):
+        """Build the /api/generate body; returns (status, body)"""
+        with self._lock:
+            self.requests += 1
+            failed = not self.healthy or self._random.random() < self.fail_rate
+
+        latency = self.latency(payload) if callable(self.latency) else self.latency
+        start = time.perf_counter()
+        if latency:
+            time.sleep(latency)
+        if failed:
+            return 500, {'error': 'stub failure'}
+
+        result = self.responder(payload)
+        if isinstance(result, dict):
+            return 200, result
+
+        elapsed_ns = int((time.perf_counter() - start) * 1e9)
+        return 200, {
+            'model': payload.get('model'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'response': result,
+            'done': True,
+            'prompt_eval_count': len(str(payload.get('prompt', ''))) // 4,
+            'eval_count': len(result) // 4,
+            'total_duration': elapsed_ns,
+            'eval_duration': elapsed_ns
+        }
+
+
+class _StubServer(ThreadingHTTPServer):
+    request_queue_size = 1024
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        stub = self.server.stub
+        if self.path == '/api/tags':
+            if stub.healthy:
+                self._send_json(200, {'models': [{'name': 'stub'}]})
+            else:
+                self._send_json(503, {'error': 'unhealthy'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self.path == '/api/generate':
+            self._send_json(*self.server.stub.generate(payload))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Ollama stub server")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = OllamaStub(port=args.port, latency=args.latency, fail_rate=args.fail_rate)
+    print(f" Ollama stub listening on {stub.url}")
+    stub.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Opt-in Profiling for Pipeline Entry Points
+Set PRIOR_AUTH_PROFILE=sample|cprofile (or pass --profile) to write
+collapsed stacks / cProfile stats and the top tracemalloc allocation sites
+"""
+
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_ENV = "PRIOR_AUTH_PROFILE"
+PROFILE_DIR_ENV = "PRIOR_AUTH_PROFILE_DIR"
+DEFAULT_PROFILE_DIR = "data/profiles"
+PROFILE_MODES = ('sample', 'cprofile')
+SAMPLE_INTERVAL = 0.005
+TOP_ALLOCATIONS = 25
+
+# Sampler/snapshotter threads; never sampled, they aren't the pipeline's work
+_profiler_threads = weakref.WeakSet()
+
+
+def add_profile_argument(parser):
+    """Add --profile {sample,cprofile} to an entry point's argparse parser"""
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=None,
+                        help=f"Profile this run (or set {PROFILE_ENV})")
+
+
+def profile_mode(mode=None):
+    """CLI value, else the environment; None when profiling is off"""
+    mode = mode or os.environ.get(PROFILE_ENV, '').strip().lower()
+    if not mode or mode in ('0', 'off', 'false', 'no'):
+        return None
+    if mode in ('1', 'on', 'true', 'yes'):
+        return 'sample'
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"{PROFILE_ENV} must be one of {', '.join(PROFILE_MODES)}")
+    return mode
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Wall-clock sampler: snapshots every thread's stack at a fixed interval"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        _profiler_threads.add(self._thread)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            skip = {thread.ident for thread in list(_profiler_threads)}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in skip:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.counts[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        """Brendan Gregg's collapsed format (flamegraph.pl, speedscope, inferno)"""
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class PeakSnapshotter:
+    """Keeps a tracemalloc snapshot from near the traced-memory peak
+
+    Live memory at exit is mostly gone; the allocation sites that matter are
+    the ones holding memory at the high-water mark.
+    """
+
+    def __init__(self, interval=0.05, growth=1.1):
+        self.interval = interval
+        self.growth = growth
+        self.snapshot = None
+        self.size = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="peak-snapshotter", daemon=True)
+
+    def start(self):
+        _profiler_threads.add(self._thread)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        import tracemalloc
+        while not self._stop.wait(self.interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self.size * self.growth:
+                self.snapshot = _filtered(tracemalloc.take_snapshot())
+                self.size = current
+
+
+def _filtered(snapshot):
+    import tracemalloc
+    return snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+
+
+def _write_allocations(f, title, snapshot):
+    stats = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+    f.write(f"\ntop {TOP_ALLOCATIONS} allocation sites ({title}):\n")
+    for stat in stats:
+        frame = stat.traceback[0]
+        f.write(f"{stat.size / 1024:>10.1f} KB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}\n")
+    return stats
+
+
+@contextmanager
+def profile_run(name, mode=None, output_dir=None):
+    """Profile the enclosed block when enabled; a plain no-op otherwise"""
+    mode = profile_mode(mode)
+    if mode is None:
+        yield
+        return
+
+    import tracemalloc
+
+    output_dir = output_dir or os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+
+    tracemalloc.start()
+    snapshotter = PeakSnapshotter()
+    snapshotter.start()
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler()
+        profiler.start()
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        snapshotter.stop()
+        exit_snapshot = _filtered(tracemalloc.take_snapshot())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        outputs = []
+        if mode == 'cprofile':
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(f"{prefix}.prof")
+            with open(f"{prefix}.pstats.txt", 'w') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+            outputs += [f"{prefix}.prof", f"{prefix}.pstats.txt"]
+        else:
+            profiler.stop()
+            profiler.write_collapsed(f"{prefix}.collapsed")
+            outputs.append(f"{prefix}.collapsed")
+
+        with open(f"{prefix}.alloc.txt", 'w') as f:
+            f.write(f"peak traced memory: {peak / 1024 / 1024:.1f} MB\n")
+            top = []
+            if snapshotter.snapshot is not None:
+                top = _write_allocations(
+                    f, f"at {snapshotter.size / 1024 / 1024:.1f} MB, near peak", snapshotter.snapshot
+                )
+            exit_top = _write_allocations(f, "live at exit", exit_snapshot)
+        outputs.append(f"{prefix}.alloc.txt")
+
+        print("\n" + "=" * 70)
+        print(f"PROFILE ({mode}): {name}")
+        print("=" * 70)
+        print(f" Wall time: {elapsed:.1f}s")
+        if mode == 'sample':
+            print(f" Samples: {profiler.samples} every {profiler.interval * 1000:.0f}ms")
+        print(f" Peak traced memory: {peak / 1024 / 1024:.1f} MB")
+        for stat in (top or exit_top)[:5]:
+            frame = stat.traceback[0]
+            print(f"   {stat.size / 1024:>9.1f} KB  {frame.filename}:{frame.lineno}")
+        for path in outputs:
+            print(f" Written: {path}")
+        print("=" * 70)
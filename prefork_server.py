@@ -0,0 +1,339 @@
+"""
+Pre-Fork Multi-Worker Serving
+The master memory-maps the case index and compact metadata once, then
+forks workers that share those pages read-only. Each worker loads its own
+embedding model with its own torch thread budget.
+"""
+
+import argparse
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import faiss
+
+from compact_metadata import CompactMetadata
+from lexical_index import LexicalIndex
+from index_manifest import check_loaded, verify_directory
+from thread_budget import ThreadBudget, split_cpus
+
+INDEX_PATH = "data/embeddings/patient_cases.index"
+EMBEDDINGS_DIR = "data/embeddings"
+
+
+def load_shared_index(index_path=INDEX_PATH, embeddings_dir=EMBEDDINGS_DIR):
+    """Memory-map the index and compact metadata, load the lexical index (call before forking)
+    
+    Returns (index, metadata, lexical_index, manifest); lexical_index is
+    None when there is no lexical_index.json, manifest when there is no
+    manifest.json.
+    """
+    manifest = verify_directory(embeddings_dir)
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        index = faiss.read_index(index_path, flags)
+    except RuntimeError:
+        # Older FAISS builds can't mmap flat indexes; pages are still shared
+        # copy-on-write because workers never write to them
+        index = faiss.read_index(index_path)
+    if not CompactMetadata.exists(embeddings_dir):
+        raise FileNotFoundError(f"No compact metadata in {embeddings_dir}; run create_embeddings.py")
+    metadata = CompactMetadata(embeddings_dir)
+    lexical_path = os.path.join(embeddings_dir, "lexical_index.json")
+    lexical_index = LexicalIndex.load(lexical_path) if os.path.exists(lexical_path) else None
+    check_loaded(index, metadata, lexical_index, manifest=manifest)
+    return index, metadata, lexical_index, manifest
+
+
+def loaded_status(index, manifest):
+    """Readiness of the build a worker serves (from what was loaded, not the disk)"""
+    manifest = manifest or {}
+    return {
+        'ready': True,
+        'vector_count': int(index.ntotal),
+        'dimension': int(index.d),
+        'model': manifest.get('model'),
+        'index_type': manifest.get('index_type', type(index).__name__),
+        'built_at': manifest.get('built_at'),
+        'problems': []
+    }
+
+
+def memory_usage(pid):
+    """RSS/PSS/shared/private (MB) from /proc/<pid>/smaps_rollup"""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    usage[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        return {}
+    return {
+        'rss_mb': usage.get('Rss', 0.0),
+        'pss_mb': usage.get('Pss', 0.0),
+        'shared_mb': usage.get('Shared_Clean', 0.0) + usage.get('Shared_Dirty', 0.0),
+        'private_mb': usage.get('Private_Clean', 0.0) + usage.get('Private_Dirty', 0.0)
+    }
+
+
+# --- Worker -----------------------------------------------------------------
+
+class _WorkerHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/ready':
+            # The build this worker loaded, even if the files have changed since
+            self._send_json(200, dict(self.server.loaded, pid=os.getpid()))
+        elif self.path == '/health':
+            self._send_json(200, {
+                'pid': os.getpid(),
+                'memory': memory_usage(os.getpid()),
+                'coalescing': self.server.system.coalescing_stats()
+            })
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        system = self.server.system
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if self.path == '/search':
+                result = system.find_similar_cases(
+                    request['text'], k=request.get('k', 3), mode=request.get('mode', 'dense')
+                )
+            elif self.path == '/decide':
+                result = system.make_decision_ollama(
+                    request['patient_document'], request['procedure_requested']
+                )
+            else:
+                self._send_json(404, {'error': 'not found'})
+                return
+        except Exception as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, {'result': result, 'pid': os.getpid()})
+
+
+class _WorkerServer(ThreadingHTTPServer):
+    # A slow /decide must not hold up /health, /ready or other requests;
+    # concurrent requests are what coalescing and scheduling act on
+    daemon_threads = True
+
+
+def _worker_main(listen_sock, case_index, case_metadata, lexical_index, manifest, thread_budget, ready_fd):
+    # Before torch is imported, so its native pools start at the budget
+    thread_budget.apply()
+
+    from prior_auth_ollama import PriorAuthSystemOllama
+    system = PriorAuthSystemOllama(
+        query_cache_path=None, case_index=case_index, case_metadata=case_metadata,
+        lexical_index=lexical_index, thread_budget=thread_budget
+    )
+
+    server = _WorkerServer(listen_sock.getsockname(), _WorkerHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_sock
+    server.system = system
+    server.loaded = loaded_status(case_index, manifest)
+
+    os.write(ready_fd, f"{os.getpid()}\n".encode())
+    os.close(ready_fd)
+    server.serve_forever()
+
+
+class PreforkServer:
+    """Master process: binds, shares the index, forks and supervises workers"""
+
+    def __init__(self, host='127.0.0.1', port=8080, workers=4, threads_per_worker=1, pin_cpus=False):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        # Optionally give each worker slot its own CPUs
+        self.worker_cpus = split_cpus(workers, threads_per_worker) if pin_cpus else [None] * workers
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(128)
+        self.case_index, self.case_metadata, self.lexical_index, self.manifest = load_shared_index()
+        # Keep the garbage collector from touching (and so copying) the
+        # master's objects, e.g. the lexical postings, in every worker
+        gc.freeze()
+        self.children = {}
+        self._stopping = False
+        self._ready_r, self._ready_w = os.pipe()
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.close(self._ready_r)
+            try:
+                budget = ThreadBudget(threads=self.threads_per_worker, cpus=self.worker_cpus[slot])
+                _worker_main(self.sock, self.case_index, self.case_metadata, self.lexical_index,
+                             self.manifest, budget, self._ready_w)
+            finally:
+                os._exit(1)
+        self.children[pid] = slot
+        return pid
+
+    def start(self, timeout=600):
+        """Fork all workers and wait until each has loaded its model"""
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        buffer = b''
+        deadline = time.time() + timeout
+        while buffer.count(b'\n') < self.workers:
+            if time.time() > deadline:
+                raise TimeoutError("workers did not become ready")
+            for pid in list(self.children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self.children.pop(pid)
+                    raise RuntimeError(f"worker {pid} exited during startup")
+            readable, _, _ = select.select([self._ready_r], [], [], 1.0)
+            if readable:
+                buffer += os.read(self._ready_r, 4096)
+        return [int(pid) for pid in buffer.split()]
+
+    def stop(self):
+        self._stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+        self.sock.close()
+
+    def supervise(self):
+        """Respawn workers that die until SIGTERM/SIGINT"""
+        def handle_signal(signum, frame):
+            self._stopping = True
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+        try:
+            while not self._stopping:
+                pid, status = os.wait()
+                slot = self.children.pop(pid, None)
+                if not self._stopping and slot is not None:
+                    print(f" Worker {pid} exited ({status}), respawning")
+                    self._spawn(slot)
+                # Drain ready notifications from respawned workers
+                while select.select([self._ready_r], [], [], 0)[0]:
+                    os.read(self._ready_r, 4096)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+# --- Memory report ----------------------------------------------------------
+
+def _probe_main():
+    """Independent process: load everything itself, then wait to be measured"""
+    from prior_auth_ollama import PriorAuthSystemOllama
+    PriorAuthSystemOllama(query_cache_path=None)
+    print("ready", flush=True)
+    sys.stdin.readline()
+
+
+def memory_report(workers, threads_per_worker, output="data/prefork_memory_report.json"):
+    """Compare per-worker memory: pre-fork workers vs. independent processes"""
+    print("\n" + "=" * 70)
+    print(f"MEMORY REPORT: {workers} workers")
+    print("=" * 70)
+
+    server = PreforkServer(port=0, workers=workers, threads_per_worker=threads_per_worker)
+    pids = server.start()
+    prefork = {
+        'master': memory_usage(os.getpid()),
+        'workers': [memory_usage(pid) for pid in pids]
+    }
+    server.stop()
+
+    probes = [
+        subprocess.Popen([sys.executable, __file__, '--probe'],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    for probe in probes:
+        while probe.stdout.readline().strip() != 'ready':
+            if probe.poll() is not None:
+                raise RuntimeError("independent process failed to start")
+    independent = {'workers': [memory_usage(probe.pid) for probe in probes]}
+    for probe in probes:
+        probe.communicate(input="\n")
+
+    print(f"\n{'Mode':<14} {'RSS/worker':>11} {'PSS/worker':>11} {'Shared/worker':>14} {'Total PSS':>10}")
+    print("-" * 70)
+    for label, data in (('pre-fork', prefork), ('independent', independent)):
+        rows = data['workers']
+        n = max(len(rows), 1)
+        total_pss = sum(r.get('pss_mb', 0) for r in rows) + data.get('master', {}).get('pss_mb', 0)
+        print(f"{label:<14} {sum(r.get('rss_mb', 0) for r in rows) / n:>10.0f}M "
+              f"{sum(r.get('pss_mb', 0) for r in rows) / n:>10.0f}M "
+              f"{sum(r.get('shared_mb', 0) for r in rows) / n:>13.0f}M {total_pss:>9.0f}M")
+        data['total_pss_mb'] = total_pss
+
+    with open(output, 'w') as f:
+        json.dump({'workers': workers, 'prefork': prefork, 'independent': independent}, f, indent=2)
+    print(f"\n Report saved to: {output}")
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PriorAuthSystemOllama with pre-forked workers")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--pin-cpus', action='store_true', help="Pin each worker to its own CPUs")
+    parser.add_argument('--report', action='store_true', help="Compare memory with independent processes")
+    parser.add_argument('--probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe_main()
+        return
+    if args.report:
+        memory_report(args.workers, args.threads_per_worker)
+        return
+
+    server = PreforkServer(args.host, args.port, args.workers, args.threads_per_worker, pin_cpus=args.pin_cpus)
+    print(f" Shared index: {server.case_index.ntotal} cases, {len(server.case_metadata)} metadata records, "
+          f"{'no' if server.lexical_index is None else len(server.lexical_index)} lexical documents")
+    server.start()
+    print(f" Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"({args.threads_per_worker} threads each{', pinned' if args.pin_cpus else ''})")
+    server.supervise()
+
+
+if __name__ == "__main__":
+    main()
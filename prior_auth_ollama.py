@@ -2,27 +2,101 @@
 Complete Prior Authorization with Ollama
 """
 
-import requests
 from sentence_transformers import SentenceTransformer
+import asyncio
 import faiss
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import json
 import numpy as np
 import os
+import time
+from contextlib import contextmanager
+from embedding_cache import QueryEmbeddingCache
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from sharded_index import ShardedCaseIndex
+from decision_cascade import default_cascade, decision_payload, run_decision_cascade, arun_decision_cascade
+from singleflight import SingleFlight, AsyncSingleFlight, request_fingerprint
+from priority_scheduler import PriorityScheduler, case_urgency
+from pipeline_profiler import profile_run
+from thread_budget import ThreadBudget
+from index_snapshots import SNAPSHOT_ROOT, SnapshotManager
+from index_manifest import check_loaded, verify_directory
+from traffic_replay import recorder_from_env
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+QUERY_CACHE_PATH = "data/embeddings/query_cache.npz"
+LEXICAL_INDEX_PATH = "data/embeddings/lexical_index.json"
+EMBEDDINGS_DIR = "data/embeddings"
 
 class PriorAuthSystemOllama:
     """Prior auth system using Ollama"""
     
-    def __init__(self):
+    def __init__(self, embedding_model=EMBEDDING_MODEL, query_cache_size=1024, query_cache_path=QUERY_CACHE_PATH,
+                 shard_root=None, shard_servers=None, decision_cascade=None,
+                 case_index=None, case_metadata=None, lexical_index=None, cpu_workers=4, thread_budget=None,
+                 snapshot_root=SNAPSHOT_ROOT, snapshot_poll_interval=30, ollama_pool=None, recorder=None,
+                 decision_concurrency=4):
         print(" Initializing system with Ollama...")
         
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # torch/FAISS threads and CPU pinning for this process (env by default)
+        self.thread_budget = thread_budget or ThreadBudget.from_env()
+        self.thread_budget.apply()
+        print(f" Thread budget: {self.thread_budget.describe()}")
+        
+        self.embedding_model_name = embedding_model
+        self.embedding_model = SentenceTransformer(embedding_model)
+        
+        # Query embeddings are reused across appeals and re-submissions
+        self.query_cache = QueryEmbeddingCache(
+            embedding_model,
+            max_entries=query_cache_size,
+            path=query_cache_path
+        )
         
-        # Load case database
-        self.case_index = faiss.read_index("data/embeddings/patient_cases.index")
-        with open("data/embeddings/metadata.json", 'r') as f:
-            self.case_metadata = json.load(f)
+        # Load case database (sharded: each shard process holds its own segment)
+        self.sharded_index = None
+        self.lexical_index = None
+        self.snapshots = None
+        if shard_root or shard_servers:
+            self.sharded_index = ShardedCaseIndex(shard_root=shard_root, servers=shard_servers)
+            self.case_index = None
+            self.case_metadata = None
+            print(f" Connected to {len(self.sharded_index.shards)} shards "
+                  f"({self.sharded_index.ntotal} patient cases)")
+        elif case_index is not None:
+            # Shared by a pre-fork master (memory-mapped, read-only)
+            self.case_index = case_index
+            self.case_metadata = case_metadata
+            self.lexical_index = lexical_index
+            print(f" Using shared index ({self.case_index.ntotal} patient cases)")
+        elif snapshot_root and SnapshotManager.available(snapshot_root):
+            # Versioned snapshots: rebuilt indexes are swapped in without a restart
+            self.snapshots = SnapshotManager(snapshot_root, poll_interval=snapshot_poll_interval,
+                                             on_swap=self._on_snapshot_swap, model_name=embedding_model)
+            self._use_snapshot(self.snapshots.current)
+            self.snapshots.start()
+            print(f" Loaded snapshot {self.snapshots.current.version} "
+                  f"({self.case_index.ntotal} patient cases)")
+        else:
+            # Refuse files that don't match their manifest (partial copy, stale metadata)
+            manifest = verify_directory(EMBEDDINGS_DIR)
+            self.case_index = faiss.read_index(os.path.join(EMBEDDINGS_DIR, "patient_cases.index"))
+            with open(os.path.join(EMBEDDINGS_DIR, "metadata.json"), 'r') as f:
+                self.case_metadata = json.load(f)
+            check_loaded(self.case_index, self.case_metadata, manifest=manifest, model_name=embedding_model)
+            print(f" Loaded {self.case_index.ntotal} patient cases")
         
-        print(f" Loaded {self.case_index.ntotal} patient cases")
+        # Keyword index for hybrid/lexical search (optional)
+        if case_index is None and self.snapshots is None and self.case_index is not None \
+                and os.path.exists(LEXICAL_INDEX_PATH):
+            self.lexical_index = LexicalIndex.load(LEXICAL_INDEX_PATH)
+            if len(self.lexical_index) != self.case_index.ntotal:
+                print(f" Lexical index has {len(self.lexical_index)} documents for "
+                      f"{self.case_index.ntotal} cases; hybrid/lexical search disabled")
+                self.lexical_index = None
+            else:
+                print(f" Loaded lexical index ({len(self.lexical_index.postings)} terms)")
         
         # Load policies
         policy_dir = "data/processed/policies"
@@ -35,25 +109,149 @@ class PriorAuthSystemOllama:
                         self.policies[procedure] = f.read()
         
         print(f" Loaded {len(self.policies)} policies")
+        
+        # Model tiers for decisions (small model first, escalate when unsure)
+        self.decision_cascade = decision_cascade or default_cascade()
+        print(f" Decision models: {' -> '.join(t['model'] for t in self.decision_cascade)}")
+        
+        # Identical concurrent decision requests share one retrieval + LLM call
+        self.decision_flights = SingleFlight()
+        self.async_decision_flights = AsyncSingleFlight()
+        
+        # Ollama pool for decisions (default: shared OLLAMA_HOSTS pool)
+        self.ollama_pool = ollama_pool
+        
+        # Decision traffic recording for replay (traffic_replay.py; PRIOR_AUTH_RECORD)
+        self.recorder = recorder or recorder_from_env()
+        if self.recorder is not None and self.recorder.path:
+            print(f" Recording decision traffic to {self.recorder.path}")
+        
+        # Async API: encoding and FAISS search run here, off the event loop
+        self.cpu_workers = cpu_workers
+        self._executor = None
+        # make_decisions(): concurrent Ollama-bound decisions (independent of cpu_workers)
+        self.decision_concurrency = decision_concurrency
         print(" Using Ollama (unlimited, FREE!)\n")
     
-    def find_similar_cases(self, patient_text, k=3):
-        """Find similar cases using RAG"""
-        query_emb = self.embedding_model.encode(patient_text, normalize_embeddings=True)
+    def _use_snapshot(self, snapshot):
+        self.case_index = snapshot.case_index
+        self.case_metadata = snapshot.case_metadata
+        self.lexical_index = snapshot.lexical_index
+    
+    def _on_snapshot_swap(self, snapshot):
+        self._use_snapshot(snapshot)
+        print(f" Swapped in index snapshot {snapshot.version} ({snapshot.case_index.ntotal} patient cases)")
+    
+    def encode_query(self, patient_text):
+        """Encode a query, reusing cached embeddings for repeated documents"""
+        return self.query_cache.get_or_encode(
+            patient_text,
+            lambda text: self.embedding_model.encode(text, normalize_embeddings=True)
+        )
+    
+    def save_query_cache(self):
+        """Persist the query embedding cache"""
+        self.query_cache.save()
+    
+    def _case_result(self, case, similarity, **extra):
+        """Build a similar-case entry from a metadata record"""
+        result = {
+            'case_id': case['case_id'],
+            'diagnosis': case['diagnosis'],
+            'procedure': case['procedure'],
+            'similarity': float(similarity)
+        }
+        # Exemplar of a pruned index (dedup_index.py) standing in for near-duplicates
+        if case.get('cluster_size', 1) > 1:
+            result['cluster_size'] = case['cluster_size']
+        result.update(extra)
+        return result
+    
+    def find_similar_cases(self, patient_text, k=3, mode='dense', candidates=50):
+        """Find similar cases using RAG
+        
+        mode: 'dense' (FAISS over all cases), 'lexical' (BM25 only, no
+        encoding) or 'hybrid' (BM25 ranking fused by reciprocal rank with
+        the dense ranking). Sharded systems always search dense.
+        """
+        with self._index_view() as view:
+            return self._search(view, patient_text, k, mode, candidates)
+    
+    @contextmanager
+    def _index_view(self):
+        """Index, metadata and lexical index to use for one search
+        
+        With snapshots, the snapshot is pinned for the whole search so a
+        concurrent hot-swap can't change ids under it.
+        """
+        if self.snapshots is None:
+            yield self
+            return
+        with self.snapshots.acquire() as snapshot:
+            yield snapshot
+    
+    def _search(self, view, patient_text, k, mode, candidates):
+        if mode != 'dense' and view.lexical_index is None:
+            mode = 'dense'
+        
+        if mode == 'lexical':
+            hits = view.lexical_index.search(patient_text, k=k)
+            top_score = hits[0][1] if hits else 1.0
+            return [
+                self._case_result(view.case_metadata[idx], score / top_score, lexical_score=score)
+                for idx, score in hits
+            ]
+        
+        if mode == 'hybrid':
+            hits = view.lexical_index.search(patient_text, k=max(candidates, k))
+            if hits:
+                return self._hybrid_rescore(view, patient_text, hits, k)
+        
+        query_emb = self.encode_query(patient_text)
         query_vec = np.array([query_emb]).astype('float32')
-        similarities, indices = self.case_index.search(query_vec, k=k)
+        
+        if self.sharded_index is not None:
+            hits = self.sharded_index.search(query_vec, k=k)[0]
+            return [self._case_result(case, sim) for sim, _, case in hits]
+        
+        similarities, indices = view.case_index.search(query_vec, k=k)
         
         similar_cases = []
         for idx, sim in zip(indices[0], similarities[0]):
-            similar_cases.append({
-                'case_id': self.case_metadata[idx]['case_id'],
-                'diagnosis': self.case_metadata[idx]['diagnosis'],
-                'procedure': self.case_metadata[idx]['procedure'],
-                'similarity': float(sim)
-            })
+            if idx < 0:
+                continue
+            similar_cases.append(self._case_result(view.case_metadata[idx], sim))
         
         return similar_cases
     
+    def _hybrid_rescore(self, view, patient_text, hits, k):
+        """Re-score the lexical candidates densely and fuse both rankings by reciprocal rank
+        
+        Only the candidates' stored vectors are scored, so no full dense
+        search runs; when there are fewer than k candidates a dense top-k
+        search tops them up so k results still come back.
+        """
+        query_emb = np.asarray(self.encode_query(patient_text), dtype='float32')
+        candidate_ids = np.array([idx for idx, _ in hits], dtype='int64')
+        scores = view.case_index.reconstruct_batch(candidate_ids) @ query_emb
+        dense_by_id = dict(zip(candidate_ids.tolist(), scores.tolist()))
+        
+        if len(hits) < k:
+            similarities, indices = view.case_index.search(query_emb[None, :], k)
+            for idx, sim in zip(indices[0], similarities[0]):
+                if idx >= 0:
+                    dense_by_id.setdefault(int(idx), float(sim))
+        
+        dense_ranking = sorted(dense_by_id, key=lambda idx: (-dense_by_id[idx], idx))
+        lexical_ranking = [idx for idx, _ in hits]
+        fused = reciprocal_rank_fusion([lexical_ranking, dense_ranking])
+        
+        lexical_by_id = dict(hits)
+        return [
+            self._case_result(view.case_metadata[idx], dense_by_id[idx], lexical_score=lexical_by_id.get(idx, 0.0))
+            for idx in fused[:k]
+        ]
+    
     def find_relevant_policy(self, procedure_name):
         """Find most relevant policy"""
         for policy_name in self.policies.keys():
@@ -61,28 +259,10 @@ class PriorAuthSystemOllama:
                 return self.policies[policy_name]
         return "Standard prior authorization criteria apply."
     
-    def make_decision_ollama(self, patient_document, procedure_requested):
-        """Make decision using Ollama"""
-        
-        print(f"\n{'='*70}")
-        print("PRIOR AUTHORIZATION REQUEST")
-        print(f"{'='*70}")
-        print(f"Procedure: {procedure_requested}")
-        
-        # Find similar cases
-        print("\n Step 1: Finding similar cases...")
-        similar_cases = self.find_similar_cases(patient_document, k=3)
-        print(" Top 3 similar cases found")
-        
-        # Get policy
-        print(f"\n Step 2: Retrieving policy...")
-        policy = self.find_relevant_policy(procedure_requested)
-        print(f" Found policy")
-        
-        # Make decision
-        print(f"\n Step 3: Evaluating with Ollama...")
-        
-        prompt = f"""You are a prior authorization specialist. Review this case against the policy.
+    @staticmethod
+    def build_decision_prompt(patient_document, procedure_requested, policy, similar_cases):
+        """Build the decision prompt"""
+        return f"""You are a prior authorization specialist. Review this case against the policy.
 
 PATIENT CASE:
 {patient_document}
@@ -107,33 +287,174 @@ Evaluate if criteria are met. Return ONLY valid JSON:
     "missing_documentation": ["list items or empty"],
     "recommendation": "clinical recommendation"
 }}"""
-
+    
+    def make_decision_ollama(self, patient_document, procedure_requested):
+        """Make decision using Ollama"""
+        
+        print(f"\n{'='*70}")
+        print("PRIOR AUTHORIZATION REQUEST")
+        print(f"{'='*70}")
+        print(f"Procedure: {procedure_requested}")
+        
+        decision = self.decide(patient_document, procedure_requested, verbose=True)
+        if decision is not None:
+            self.display_decision(decision)
+        return decision
+    
+    def decide(self, patient_document, procedure_requested, verbose=False):
+        """Decision for one request; identical in-flight requests share one evaluation"""
+        key = request_fingerprint(patient_document, procedure_requested)
+        run = lambda call_id=None: self.decision_flights.do(
+            key, lambda: self._evaluate_request(patient_document, procedure_requested, verbose=verbose,
+                                                call_id=call_id)
+        )
+        if self.recorder is None:
+            return run()
+        return self.recorder.record(key, patient_document, procedure_requested, run)
+    
+    def _evaluate_request(self, patient_document, procedure_requested, verbose=True, call_id=None):
+        """Retrieve context and run the decision cascade (once per in-flight request)
+        
+        call_id is the recorder's id for the call this evaluation runs for.
+        """
+        log = print if verbose else (lambda *args: None)
+        
+        # Find similar cases
+        log("\n Step 1: Finding similar cases...")
+        start = time.perf_counter()
+        similar_cases = self.find_similar_cases(patient_document, k=3)
+        log(" Top 3 similar cases found")
+        
+        # Get policy
+        log(f"\n Step 2: Retrieving policy...")
+        policy = self.find_relevant_policy(procedure_requested)
+        retrieval_seconds = time.perf_counter() - start
+        log(f" Found policy")
+        
+        # Make decision
+        log(f"\n Step 3: Evaluating with Ollama...")
+        
+        prompt = self.build_decision_prompt(patient_document, procedure_requested, policy, similar_cases)
+        run = lambda pool: run_decision_cascade(
+            decision_payload(prompt),
+            tiers=self.decision_cascade,
+            pool=pool,
+            timeout=120
+        )
+        
         try:
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    'model': 'llama3.2',
-                    'prompt': prompt,
-                    'stream': False,
-                    'format': 'json'
-                },
-                timeout=120
+            if self.recorder is None:
+                return run(self.ollama_pool)
+            return self.recorder.trace(
+                call_id, similar_cases, policy, prompt, retrieval_seconds, run, pool=self.ollama_pool
             )
-            
-            if response.status_code == 200:
-                result = response.json()['response']
-                result = result.replace('```json', '').replace('```', '').strip()
-                decision = json.loads(result)
-                self.display_decision(decision)
-                return decision
-            else:
-                print(f" Error: Status {response.status_code}")
-                return None
                 
         except Exception as e:
             print(f" Error: {e}")
             return None
     
+    def make_decisions(self, requests, scheduler=None):
+        """Decide many requests by urgency instead of arrival order
+        
+        Each request is a dict with patient_document, procedure_requested and
+        optionally urgency (elective/urgent/emergent) or the processed case
+        dict, whose clinical_assessment.urgency is used instead. Returns
+        decisions in input order.
+        """
+        own_scheduler = scheduler is None
+        if own_scheduler:
+            n = max(1, self.decision_concurrency)
+            # Keep a slot for urgent work only when there is more than one
+            scheduler = PriorityScheduler(max_concurrency=n, reserved_slots=min(1, n - 1))
+        
+        def decide(request):
+            return self.decide(request['patient_document'], request['procedure_requested'])
+        
+        def urgency(request):
+            if request.get('urgency') is None and isinstance(request.get('case'), dict):
+                return case_urgency(request['case'])
+            return request.get('urgency')
+        
+        try:
+            return scheduler.map(decide, requests, [urgency(r) for r in requests])
+        finally:
+            if own_scheduler:
+                scheduler.shutdown()
+    
+    def coalescing_stats(self):
+        """Requests vs. actual evaluations for the sync and async decision paths"""
+        return {
+            'sync': self.decision_flights.stats(),
+            'async': self.async_decision_flights.stats()
+        }
+    
+    # --- Async API ----------------------------------------------------------
+    
+    def _run_cpu(self, func, *args, **kwargs):
+        """Run CPU-bound work (encoding, FAISS) in the executor"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="prior-auth-cpu")
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    async def afind_similar_cases(self, patient_text, k=3, mode='dense', candidates=50):
+        """Async find_similar_cases(); encoding and search run in the executor"""
+        return await self._run_cpu(self.find_similar_cases, patient_text, k=k, mode=mode, candidates=candidates)
+    
+    async def afind_relevant_policy(self, procedure_name):
+        """Async find_relevant_policy() (in-memory lookup, never blocks)"""
+        return self.find_relevant_policy(procedure_name)
+    
+    async def amake_decision_ollama(self, patient_document, procedure_requested):
+        """Async make_decision_ollama() without console output
+        
+        Pending decisions cost a coroutine each instead of a blocked thread;
+        HTTP goes through the pool's shared httpx.AsyncClient.
+        """
+        key = request_fingerprint(patient_document, procedure_requested)
+        run = lambda call_id=None: self.async_decision_flights.do(
+            key, lambda: self._aevaluate_request(patient_document, procedure_requested, call_id=call_id)
+        )
+        if self.recorder is None:
+            return await run()
+        return await self.recorder.arecord(key, patient_document, procedure_requested, run)
+    
+    async def _aevaluate_request(self, patient_document, procedure_requested, call_id=None):
+        start = time.perf_counter()
+        similar_cases = await self.afind_similar_cases(patient_document, k=3)
+        policy = await self.afind_relevant_policy(procedure_requested)
+        retrieval_seconds = time.perf_counter() - start
+        prompt = self.build_decision_prompt(patient_document, procedure_requested, policy, similar_cases)
+        run = lambda pool: arun_decision_cascade(
+            decision_payload(prompt),
+            tiers=self.decision_cascade,
+            pool=pool,
+            timeout=120
+        )
+        
+        try:
+            if self.recorder is None:
+                return await run(self.ollama_pool)
+            return await self.recorder.atrace(
+                call_id, similar_cases, policy, prompt, retrieval_seconds, run, pool=self.ollama_pool
+            )
+        except Exception as e:
+            print(f" Error: {e}")
+            return None
+    
+    def close(self):
+        """Release the executor, stop the snapshot watcher and shards, close the recorder and persist the query cache"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self.snapshots is not None:
+            self.snapshots.stop()
+        if self.sharded_index is not None:
+            self.sharded_index.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.save_query_cache()
+    
     def display_decision(self, decision):
         """Display decision"""
         print(f"\n{'='*70}")
@@ -150,6 +471,11 @@ Evaluate if criteria are met. Return ONLY valid JSON:
         
         print(f"Confidence: {decision['confidence']}")
         
+        decided_by = decision.get('decided_by')
+        if decided_by:
+            print(f"Decided by: {decided_by['model']} (tier {decided_by['tier'] + 1}"
+                  f", {len(decided_by['escalations'])} escalations)")
+        
         print(f"\n{'-'*70}")
         print("CRITERIA EVALUATION:")
         print(f"{'-'*70}")
@@ -208,6 +534,10 @@ def test_system():
         with open('sample_decision_ollama.json', 'w') as f:
             json.dump(decision, f, indent=2)
         print(" Decision saved to: sample_decision_ollama.json")
+    
+    system.save_query_cache()
+    print(f" Query cache: {system.query_cache.stats()}")
 
 if __name__ == "__main__":
-    test_system()
+    with profile_run('prior_auth_ollama'):
+        test_system()
@@ -0,0 +1,207 @@
+"""
+Urgency-Aware Priority Scheduler
+Runs Ollama-bound work from per-urgency queues (emergent > urgent > elective)
+with aging, reserved concurrency for non-elective work and per-class SLAs
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+URGENCY_LEVELS = ('emergent', 'urgent', 'elective')
+DEFAULT_URGENCY = 'elective'
+# Target time from submission to completion, per class
+DEFAULT_SLA_SECONDS = {'emergent': 60, 'urgent': 300, 'elective': 3600}
+
+
+def normalize_urgency(value):
+    """Map an extraction's clinical_assessment.urgency to a scheduler class"""
+    value = str(value or '').strip().lower()
+    return value if value in URGENCY_LEVELS else DEFAULT_URGENCY
+
+
+def case_urgency(case):
+    """Urgency class of a processed case dict (elective when unknown)"""
+    assessment = case.get('clinical_assessment') or {}
+    return normalize_urgency(assessment.get('urgency'))
+
+
+class _Task:
+    def __init__(self, urgency, func, args, kwargs):
+        self.urgency = urgency
+        self.level = URGENCY_LEVELS.index(urgency)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+
+
+class _ClassStats:
+    def __init__(self, sla_seconds, window):
+        self.sla_seconds = sla_seconds
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.promoted = 0
+        self.sla_misses = 0
+        self.waits = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self, queued, running):
+        def percentile(samples, p):
+            if not samples:
+                return None
+            samples = sorted(samples)
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        finished = self.completed + self.failed
+        return {
+            'queued': queued,
+            'running': running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'promoted': self.promoted,
+            'wait_p50': percentile(self.waits, 0.50),
+            'wait_p95': percentile(self.waits, 0.95),
+            'latency_p50': percentile(self.latencies, 0.50),
+            'latency_p95': percentile(self.latencies, 0.95),
+            'latency_max': max(self.latencies) if self.latencies else None,
+            'sla_seconds': self.sla_seconds,
+            'sla_misses': self.sla_misses,
+            'sla_met_rate': 1 - self.sla_misses / finished if finished else None
+        }
+
+
+class PriorityScheduler:
+    """Fixed pool of workers pulling from per-urgency FIFO queues
+
+    Each worker takes the waiting task with the highest effective priority;
+    a task gains one level for every aging_seconds it waits, so elective
+    work cannot starve. At most max_concurrency - reserved_slots elective
+    tasks run at once, keeping capacity free for emergent/urgent arrivals.
+    """
+
+    def __init__(self, max_concurrency=4, reserved_slots=1, aging_seconds=120,
+                 sla_seconds=None, stats_window=10000):
+        if not 0 <= reserved_slots < max_concurrency:
+            raise ValueError("reserved_slots must be between 0 and max_concurrency - 1")
+        self.max_concurrency = max_concurrency
+        self.reserved_slots = reserved_slots
+        self.aging_seconds = aging_seconds
+        sla_seconds = {**DEFAULT_SLA_SECONDS, **(sla_seconds or {})}
+        self.queues = {urgency: deque() for urgency in URGENCY_LEVELS}
+        self.running = {urgency: 0 for urgency in URGENCY_LEVELS}
+        self.class_stats = {urgency: _ClassStats(sla_seconds[urgency], stats_window) for urgency in URGENCY_LEVELS}
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"priority-worker-{i}", daemon=True)
+            for i in range(max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, func, *args, urgency=DEFAULT_URGENCY, **kwargs):
+        """Queue func(*args, **kwargs) under an urgency class; returns a Future"""
+        task = _Task(normalize_urgency(urgency), func, args, kwargs)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("scheduler is shut down")
+            self.queues[task.urgency].append(task)
+            self.class_stats[task.urgency].submitted += 1
+            self._cond.notify()
+        return task.future
+
+    def map(self, func, items, urgencies):
+        """Submit func(item) for each item; results in input order"""
+        futures = [self.submit(func, item, urgency=urgency) for item, urgency in zip(items, urgencies)]
+        return [future.result() for future in futures]
+
+    def _effective_level(self, task, now):
+        if not self.aging_seconds:
+            return task.level
+        return max(0, task.level - int((now - task.submitted_at) // self.aging_seconds))
+
+    def _next_task(self):
+        """Pick the next task (caller holds the lock); None if nothing may run"""
+        now = time.monotonic()
+        elective_cap = self.max_concurrency - self.reserved_slots
+        best = None
+        for urgency in URGENCY_LEVELS:
+            queue = self.queues[urgency]
+            if not queue:
+                continue
+            if urgency == 'elective' and self.running['elective'] >= elective_cap:
+                continue
+            # Within a class the head is the oldest, so it also has the most aging
+            head = queue[0]
+            key = (self._effective_level(head, now), head.submitted_at)
+            if best is None or key < best[0]:
+                best = (key, head)
+        if best is None:
+            return None
+        task = best[1]
+        self.queues[task.urgency].popleft()
+        if best[0][0] < task.level:
+            self.class_stats[task.urgency].promoted += 1
+        self.running[task.urgency] += 1
+        return task
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._shutdown and not any(self.queues.values()):
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+
+            task.started_at = time.monotonic()
+            try:
+                result = task.func(*task.args, **task.kwargs)
+                error = None
+            except BaseException as e:
+                result, error = None, e
+            finished_at = time.monotonic()
+
+            with self._cond:
+                self.running[task.urgency] -= 1
+                stats = self.class_stats[task.urgency]
+                latency = finished_at - task.submitted_at
+                stats.waits.append(task.started_at - task.submitted_at)
+                stats.latencies.append(latency)
+                if error is None:
+                    stats.completed += 1
+                else:
+                    stats.failed += 1
+                if latency > stats.sla_seconds:
+                    stats.sla_misses += 1
+                # A finished elective task may unblock a waiting worker
+                self._cond.notify_all()
+
+            if error is None:
+                task.future.set_result(result)
+            else:
+                task.future.set_exception(error)
+
+    def stats(self):
+        """Per-class queue depth, wait/latency percentiles and SLA misses"""
+        with self._cond:
+            return {
+                urgency: self.class_stats[urgency].snapshot(len(self.queues[urgency]), self.running[urgency])
+                for urgency in URGENCY_LEVELS
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; queued tasks still run"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
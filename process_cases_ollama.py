@@ -2,98 +2,223 @@
 Process All MTSamples Cases with Ollama (UNLIMITED, FREE)
 """
 
-import requests
 import os
 import json
 import pandas as pd
 from tqdm import tqdm
 import time
+from ollama_pool import get_pool, OllamaError
+from work_queue import LeaseKeeper, WorkQueue, default_worker_id
+from schemas import (
+    EXTRACTION_SCHEMA, BATCH_EXTRACTION_SCHEMA, EXTRACTION_NUM_PREDICT,
+    parse_extraction, parse_batch_extraction, generation_stats
+)
+from pydantic import ValidationError
+from transcription_sections import trim_transcription, estimate_tokens, TRANSCRIPTION_TOKEN_BUDGET
+from pipeline_profiler import add_profile_argument, profile_run
 
-def extract_clinical_info_ollama(text, case_id, specialty):
-    """Extract structured clinical information using Ollama"""
-    
-    text = str(text)[:5000]
-    
-    prompt = f"""Extract clinical information from this medical document. Return ONLY valid JSON, no other text.
-
-SPECIALTY: {specialty}
+WORK_QUEUE_PATH = "data/work_queue.db"
 
-DOCUMENT:
-{text}
+# Multi-document batching: notes under SHORT_CASE_TOKENS are packed into one
+# request of up to BATCH_TOKEN_BUDGET document tokens (and BATCH_MAX_CASES)
+SHORT_CASE_TOKENS = 400
+BATCH_TOKEN_BUDGET = 1600
+BATCH_MAX_CASES = 6
 
-Return JSON with this exact structure:
-{{
-    "patient_demographics": {{
+EXTRACTION_JSON_TEMPLATE = """{
+    "patient_demographics": {
         "age": "patient age or null",
         "gender": "patient gender or null",
         "chief_complaint": "main presenting problem"
-    }},
-    "clinical_information": {{
+    },
+    "clinical_information": {
         "diagnosis": "primary diagnosis",
         "symptoms": "key symptoms",
         "symptom_duration": "duration or null",
         "physical_exam_findings": "key findings"
-    }},
-    "diagnostic_tests": {{
+    },
+    "diagnostic_tests": {
         "imaging": "imaging studies or null",
         "labs": "lab tests or null",
         "other_tests": "other tests or null"
-    }},
-    "treatment": {{
+    },
+    "treatment": {
         "procedure_performed": "procedure done or null",
         "procedure_planned": "procedure planned or null",
         "medications": "medications or null",
         "conservative_treatments": "non-surgical treatments or null"
-    }},
-    "clinical_assessment": {{
+    },
+    "clinical_assessment": {
         "severity": "mild/moderate/severe or null",
         "urgency": "elective/urgent/emergent or null",
         "prognosis": "expected outcome or null"
-    }}
-}}
+    }
+}"""
+
+def build_extraction_prompt(text, specialty, token_budget=TRANSCRIPTION_TOKEN_BUDGET):
+    """Build the extraction prompt for one transcription"""
+    
+    # Keep DIAGNOSIS/PROCEDURE/IMPRESSION/PLAN etc. over operative boilerplate
+    text = trim_transcription(text, token_budget)
+    
+    return f"""Extract clinical information from this medical document. Return ONLY valid JSON, no other text.
+
+SPECIALTY: {specialty}
+
+DOCUMENT:
+{text}
+
+Return JSON with this exact structure:
+{EXTRACTION_JSON_TEMPLATE}
 
 Extract only explicitly stated information. Use null for missing data."""
 
+def extraction_payload(prompt):
+    """/api/generate body for an extraction prompt (schema-constrained, capped)"""
+    return {
+        'model': 'llama3.2',
+        'prompt': prompt,
+        'stream': False,
+        'format': EXTRACTION_SCHEMA,
+        'options': {'num_predict': EXTRACTION_NUM_PREDICT}
+    }
+
+def extract_clinical_info_ollama(text, case_id, specialty):
+    """Extract structured clinical information using Ollama"""
+    
+    prompt = build_extraction_prompt(text, specialty)
+    
     try:
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                'model': 'llama3.2',
-                'prompt': prompt,
-                'stream': False,
-                'format': 'json'
-            },
-            timeout=60
-        )
-        
-        if response.status_code != 200:
-            return None
-        
-        result = response.json()['response']
+        body = get_pool().generate(extraction_payload(prompt), timeout=60)
         
-        # Clean and parse
-        result = result.replace('```json', '').replace('```', '').strip()
-        parsed = json.loads(result)
+        # Validate against the schema (drops invented keys, caps field lengths)
+        parsed = parse_extraction(body['response']).model_dump()
         
         # Add metadata
         parsed['meta'] = {
             'case_id': case_id,
             'original_specialty': specialty,
-            'processing_timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+            'processing_timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'generation': generation_stats(body)
         }
         
         return parsed
         
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, ValidationError, OllamaError):
         return None
     except Exception as e:
         return None
 
+def build_batch_extraction_prompt(cases):
+    """Build one extraction prompt for several short documents"""
+    
+    documents = "\n\n".join(
+        f"=== CASE {case['case_id']} (SPECIALTY: {case['specialty']}) ===\n{case['text']}"
+        for case in cases
+    )
+    
+    return f"""Extract clinical information from each of these {len(cases)} medical documents. Return ONLY valid JSON, no other text.
+
+{documents}
+
+Return JSON of the form {{"cases": [...]}} with one entry per document, in order.
+Each entry has "case_id" set to the CASE id above plus this exact structure:
+{EXTRACTION_JSON_TEMPLATE}
+
+Extract only explicitly stated information from that document. Use null for missing data."""
+
+def pack_short_cases(cases, short_threshold=SHORT_CASE_TOKENS,
+                     token_budget=BATCH_TOKEN_BUDGET, max_cases=BATCH_MAX_CASES):
+    """Group short cases into batches; long cases come back as single-case batches"""
+    batch = []
+    batch_tokens = 0
+    for case in cases:
+        tokens = estimate_tokens(str(case['text']))
+        if tokens > short_threshold:
+            yield [case]
+            continue
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_cases):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(case)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def extract_clinical_info_batch_ollama(cases, stats=None):
+    """Extract several short documents in one call
+    
+    cases: [{'case_id', 'text', 'specialty'}]. Returns {case_id: extracted}.
+    Cases missing or invalid in the batch answer fall back to a single-case
+    call. stats (a dict) accumulates calls, fallbacks and prompt tokens:
+    prompt_tokens and single_prompt_tokens (one call per case) are both
+    estimates, so they compare; measured_prompt_tokens sums Ollama's
+    prompt_eval_count where it is reported.
+    """
+    stats = stats if stats is not None else {}
+    for key in ('calls', 'cases', 'fallbacks', 'prompt_tokens', 'single_prompt_tokens', 'measured_prompt_tokens'):
+        stats.setdefault(key, 0)
+    stats['cases'] += len(cases)
+    stats['single_prompt_tokens'] += sum(
+        estimate_tokens(build_extraction_prompt(c['text'], c['specialty'])) for c in cases
+    )
+    
+    batch_results = {}
+    if len(cases) > 1:
+        prompt = build_batch_extraction_prompt(cases)
+        stats['calls'] += 1
+        stats['prompt_tokens'] += estimate_tokens(prompt)
+        try:
+            body = get_pool().generate(
+                {
+                    'model': 'llama3.2',
+                    'prompt': prompt,
+                    'stream': False,
+                    'format': BATCH_EXTRACTION_SCHEMA,
+                    'options': {'num_predict': EXTRACTION_NUM_PREDICT * len(cases)}
+                },
+                timeout=60 * len(cases)
+            )
+            stats['measured_prompt_tokens'] += body.get('prompt_eval_count') or 0
+            batch_results = parse_batch_extraction(body['response'])
+        except Exception:
+            # Every case falls back to a single-case call below
+            batch_results = {}
+    
+    results = {}
+    for case in cases:
+        parsed = batch_results.get(case['case_id'])
+        if parsed is not None:
+            parsed = parsed.model_dump()
+            parsed['meta'] = {
+                'case_id': case['case_id'],
+                'original_specialty': case['specialty'],
+                'processing_timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'batch_size': len(cases)
+            }
+        else:
+            if len(cases) > 1:
+                stats['fallbacks'] += 1
+            parsed = extract_clinical_info_ollama(case['text'], case['case_id'], case['specialty'])
+            stats['calls'] += 1
+            generation = parsed['meta']['generation'] if parsed else {}
+            stats['measured_prompt_tokens'] += generation.get('prompt_tokens') or 0
+            stats['prompt_tokens'] += estimate_tokens(build_extraction_prompt(case['text'], case['specialty']))
+        results[case['case_id']] = parsed
+    
+    return results
+
 def process_all_cases(
     input_file="data/raw/mtsamples.csv",
-    output_dir="data/processed/cases"
+    output_dir="data/processed/cases",
+    batch=False,
+    stream=False
 ):
-    """Process all cases"""
+    """Process all cases
+    
+    batch=True packs short transcriptions into multi-document requests.
+    stream=True embeds and indexes each case as soon as it is saved.
+    """
     
     print("\n" + "=" * 70)
     print("PROCESSING WITH OLLAMA (UNLIMITED & FREE!)")
@@ -145,14 +270,70 @@ def process_all_cases(
         print(" Cancelled")
         return
     
-    # Process cases
+    print("\n Processing cases...")
+    print(" This runs UNLIMITED - no daily limits!\n")
+    
+    indexer = None
+    on_saved = None
+    if stream:
+        from streaming_pipeline import start_streaming_indexer
+        indexer = start_streaming_indexer(processed_dir=output_dir)
+        on_saved = lambda case_id, extracted: indexer.submit(extracted, f"{case_id}.json")
+    
+    batch_stats = {}
+    try:
+        if batch:
+            processed, skipped, errors = process_cases_batched(df, output_dir, already_processed, batch_stats, on_saved)
+        else:
+            processed, skipped, errors = process_cases_sequential(df, output_dir, already_processed, on_saved)
+    finally:
+        stream_stats = indexer.close() if indexer else None
+    
+    # Save summary
+    print("\n" + "=" * 70)
+    print("PROCESSING COMPLETE")
+    print("=" * 70)
+    print(f" Newly processed: {processed}")
+    print(f" Skipped (already done): {skipped}")
+    print(f" Errors: {errors}")
+    print(f" Total processed: {processed + skipped}")
+    print(f" Cost: $0")
+    
+    summary = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'newly_processed': processed,
+        'total_processed': processed + skipped,
+        'errors': errors,
+        'output_directory': output_dir
+    }
+    
+    if batch_stats.get('cases'):
+        batch_stats['calls_saved'] = batch_stats['cases'] - batch_stats['calls']
+        batch_stats['prompt_tokens_saved'] = batch_stats['single_prompt_tokens'] - batch_stats['prompt_tokens']
+        summary['batching'] = batch_stats
+        print(f" LLM calls: {batch_stats['calls']} for {batch_stats['cases']} cases "
+              f"({batch_stats['calls_saved']} saved, {batch_stats['fallbacks']} fallbacks)")
+        print(f" Prompt tokens saved: ~{batch_stats['prompt_tokens_saved']} (estimated; "
+              f"{batch_stats['measured_prompt_tokens']} prompt tokens measured by Ollama)")
+    
+    if stream_stats:
+        summary['streaming'] = stream_stats
+        print(f" Indexed while extracting: {stream_stats['indexed']} "
+              f"({stream_stats['total_indexed']} in index, {stream_stats['batches']} batches, "
+              f"{stream_stats['backpressure_seconds']:.1f}s backpressure)")
+    
+    with open('data/processing_summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    
+    print(f"\n Summary saved to: data/processing_summary.json")
+
+def process_cases_sequential(df, output_dir, already_processed, on_saved=None):
+    """Extract all unprocessed rows, one request per case"""
+    
     processed = 0
     skipped = 0
     errors = 0
     
-    print("\n Processing cases...")
-    print(" This runs UNLIMITED - no daily limits!\n")
-    
     for idx, row in tqdm(df.iterrows(), total=len(df), desc="Extracting"):
         case_id = f"case_{idx:04d}"
         
@@ -178,9 +359,9 @@ def process_all_cases(
                 }
                 
                 # Save to file
-                output_path = os.path.join(output_dir, f"{case_id}.json")
-                with open(output_path, 'w') as f:
-                    json.dump(extracted, f, indent=2)
+                save_case(output_dir, case_id, extracted)
+                if on_saved:
+                    on_saved(case_id, extracted)
                 
                 processed += 1
             else:
@@ -193,28 +374,203 @@ def process_all_cases(
             errors += 1
             continue
     
-    # Save summary
-    print("\n" + "=" * 70)
-    print("PROCESSING COMPLETE")
-    print("=" * 70)
-    print(f" Newly processed: {processed}")
-    print(f" Skipped (already done): {skipped}")
-    print(f" Errors: {errors}")
-    print(f" Total processed: {processed + skipped}")
-    print(f" Cost: $0")
+    return processed, skipped, errors
+
+def process_cases_batched(df, output_dir, already_processed, stats, on_saved=None):
+    """Extract all unprocessed rows, packing short ones per request"""
     
-    summary = {
-        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-        'newly_processed': processed,
-        'total_processed': processed + skipped,
-        'errors': errors,
-        'output_directory': output_dir
-    }
+    rows = {}
+    cases = []
+    skipped = 0
+    for idx, row in df.iterrows():
+        case_id = f"case_{idx:04d}"
+        if case_id in already_processed:
+            skipped += 1
+            continue
+        rows[case_id] = (idx, row)
+        cases.append({
+            'case_id': case_id,
+            'text': str(row['transcription']),
+            'specialty': str(row['medical_specialty'])
+        })
     
-    with open('data/processing_summary.json', 'w') as f:
-        json.dump(summary, f, indent=2)
+    processed = 0
+    errors = 0
+    progress = tqdm(total=len(cases), desc="Extracting")
+    for pack in pack_short_cases(cases):
+        try:
+            results = extract_clinical_info_batch_ollama(pack, stats)
+        except Exception:
+            results = {}
+        
+        for case in pack:
+            extracted = results.get(case['case_id'])
+            if extracted:
+                idx, row = rows[case['case_id']]
+                extracted['original_data'] = {
+                    'index': int(idx),
+                    'specialty': case['specialty'],
+                    'sample_name': str(row['sample_name']),
+                    'description': str(row['description'])
+                }
+                save_case(output_dir, case['case_id'], extracted)
+                if on_saved:
+                    on_saved(case['case_id'], extracted)
+                processed += 1
+            else:
+                errors += 1
+        progress.update(len(pack))
+    progress.close()
     
-    print(f"\n Summary saved to: data/processing_summary.json")
+    return processed, skipped, errors
+
+def save_case(output_dir, case_id, extracted):
+    """Write a processed case atomically (readers never see partial JSON)"""
+    output_path = os.path.join(output_dir, f"{case_id}.json")
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(extracted, f, indent=2)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def seed_work_queue(
+    input_file="data/raw/mtsamples.csv",
+    output_dir="data/processed/cases",
+    queue_path=WORK_QUEUE_PATH
+):
+    """Seed the durable work queue from the CSV"""
+    
+    print(f"\n Reading {input_file}...")
+    df = pd.read_csv(input_file)
+    df = df.dropna(subset=['transcription'])
+    df = df[df['transcription'].str.len() >= 100]
+    
+    queue = WorkQueue(queue_path)
+    added = queue.seed(
+        (f"case_{idx:04d}", {
+            'index': int(idx),
+            'transcription': str(row['transcription']),
+            'specialty': str(row['medical_specialty']),
+            'sample_name': str(row['sample_name']),
+            'description': str(row['description'])
+        })
+        for idx, row in df.iterrows()
+    )
+    
+    # Cases finished by earlier (non-queue) runs count as done
+    if os.path.exists(output_dir):
+        queue.mark_done(f.replace('.json', '') for f in os.listdir(output_dir) if f.endswith('.json'))
+    
+    print(f" Seeded {added} new cases into {queue_path}")
+    print(f" Queue status: {queue.counts()}")
+    queue.close()
+
+def run_worker(
+    output_dir="data/processed/cases",
+    queue_path=WORK_QUEUE_PATH,
+    worker_id=None,
+    lease_seconds=300,
+    poll_interval=5
+):
+    """Claim and process cases from the work queue until it is drained
+    
+    Safe to run as many concurrent processes as needed; a crashed worker's
+    cases are re-queued when their lease expires. The lease is renewed while
+    a case is extracted; the output is moved into place while the lease is
+    held and only then is the case completed.
+    """
+    
+    worker_id = worker_id or default_worker_id()
+    queue = WorkQueue(queue_path)
+    keeper = LeaseKeeper(queue_path, worker_id, lease_seconds)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    print(f"\n Worker {worker_id} started ({queue.counts()})")
+    
+    processed = 0
+    errors = 0
+    lost = 0
+    
+    while True:
+        item = queue.claim(worker_id, lease_seconds=lease_seconds)
+        
+        if item is None:
+            if not queue.pending():
+                break
+            # Other workers hold the remaining leases; wait in case they expire
+            time.sleep(poll_interval)
+            continue
+        
+        case_id = item['case_id']
+        payload = item['payload']
+        keeper.hold(case_id)
+        
+        try:
+            extracted = extract_clinical_info_ollama(payload['transcription'], case_id, payload['specialty'])
+            
+            if extracted:
+                extracted['original_data'] = {
+                    'index': payload['index'],
+                    'specialty': payload['specialty'],
+                    'sample_name': payload['sample_name'],
+                    'description': payload['description']
+                }
+                # Written aside and moved into place only if the lease is still ours
+                output_path = os.path.join(output_dir, f"{case_id}.json")
+                tmp_path = f"{output_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(extracted, f, indent=2)
+                if keeper.lost:
+                    os.remove(tmp_path)
+                    print(f"\n Lease on {case_id} lost to another worker; discarding result")
+                    lost += 1
+                    continue
+                # Output before complete(): a crash in between re-runs the case
+                # (overwriting is harmless) instead of leaving it done without output
+                os.replace(tmp_path, output_path)
+                if queue.complete(case_id, worker_id):
+                    processed += 1
+                else:
+                    print(f"\n Lease on {case_id} lost to another worker while completing")
+                    lost += 1
+            else:
+                queue.fail(case_id, worker_id, "extraction returned no valid JSON")
+                errors += 1
+                
+        except Exception as e:
+            queue.fail(case_id, worker_id, e)
+            errors += 1
+        finally:
+            keeper.release()
+    
+    keeper.stop()
+    print(f"\n Worker {worker_id} finished: {processed} processed, {errors} errors, {lost} leases lost")
+    print(f" Queue status: {queue.counts()}")
+    queue.close()
 
 if __name__ == "__main__":
-    process_all_cases()
+    import argparse
+    parser = argparse.ArgumentParser(description="Extract clinical info from MTSamples with Ollama")
+    parser.add_argument('--seed', action='store_true', help="Seed the work queue from the CSV")
+    parser.add_argument('--worker', action='store_true', help="Process cases from the work queue")
+    parser.add_argument('--status', action='store_true', help="Show work queue status")
+    parser.add_argument('--queue', default=WORK_QUEUE_PATH)
+    parser.add_argument('--worker-id', default=None)
+    parser.add_argument('--lease-seconds', type=int, default=300)
+    parser.add_argument('--batch', action='store_true', help="Pack short transcriptions into one request")
+    parser.add_argument('--stream', action='store_true', help="Embed and index each case as soon as it is extracted")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    if args.stream and args.worker:
+        # Every worker would checkpoint its own live index over the same files
+        parser.error("--stream is not supported with --worker; run create_embeddings.py after the queue is drained")
+    
+    with profile_run('process_cases_ollama', args.profile):
+        if args.seed:
+            seed_work_queue(queue_path=args.queue)
+        if args.worker:
+            run_worker(queue_path=args.queue, worker_id=args.worker_id, lease_seconds=args.lease_seconds)
+        if args.status:
+            print(WorkQueue(args.queue).counts())
+        if not (args.seed or args.worker or args.status):
+            process_all_cases(batch=args.batch, stream=args.stream)
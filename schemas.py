@@ -0,0 +1,202 @@
+"""
+Response Schemas for Extraction and Decision Prompts
+Passed to Ollama as structured-output schemas and used to validate replies
+"""
+
+import json
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, BeforeValidator, Field
+from typing_extensions import Annotated
+
+# Total output token caps (Ollama 'num_predict')
+EXTRACTION_NUM_PREDICT = 600
+DECISION_NUM_PREDICT = 900
+
+
+def _capped_text(max_chars):
+    """String field capped at max_chars; numbers are coerced, 'null' becomes None"""
+
+    def coerce(value):
+        if value is None:
+            return None
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value)
+        value = str(value).strip()
+        if not value or value.lower() in ('null', 'none', 'n/a'):
+            return None
+        return value[:max_chars]
+
+    return Annotated[
+        Optional[Annotated[str, Field(max_length=max_chars)]],
+        BeforeValidator(coerce),
+        Field(default=None)
+    ]
+
+
+def _truncated(max_chars):
+    """Required string field, truncated to max_chars; None becomes ''"""
+    return Annotated[
+        str, BeforeValidator(lambda v: '' if v is None else str(v)[:max_chars]), Field(max_length=max_chars)
+    ]
+
+
+def _capped_list(item_type, max_items):
+    """List field keeping at most max_items entries"""
+
+    def coerce(value):
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            value = [value]
+        return value[:max_items]
+
+    return Annotated[List[item_type], BeforeValidator(coerce), Field(default_factory=list, max_length=max_items)]
+
+
+def _choice(*options):
+    """Enum field; case-insensitive, anything else becomes None"""
+
+    def coerce(value):
+        if value is None:
+            return None
+        value = str(value).strip().lower()
+        return value if value in options else None
+
+    return Annotated[Optional[Literal[options]], BeforeValidator(coerce), Field(default=None)]
+
+
+def _label(*options):
+    """Required enum field; case-insensitive, spaces/hyphens read as underscores"""
+
+    def coerce(value):
+        if value is None:
+            return value
+        return str(value).strip().upper().replace('-', '_').replace(' ', '_')
+
+    return Annotated[Literal[options], BeforeValidator(coerce)]
+
+
+# Enum fields (module-level so annotations stay plain names)
+Severity = _choice('mild', 'moderate', 'severe')
+Urgency = _choice('elective', 'urgent', 'emergent')
+CriterionStatus = _label('MET', 'NOT_MET')
+DecisionLabel = _label('APPROVED', 'DENIED', 'ADDITIONAL_INFO_NEEDED')
+ConfidenceLabel = _label('HIGH', 'MEDIUM', 'LOW')
+
+
+# --- Extraction -------------------------------------------------------------
+
+class PatientDemographics(BaseModel):
+    age: _capped_text(20)
+    gender: _capped_text(20)
+    chief_complaint: _capped_text(200)
+
+
+class ClinicalInformation(BaseModel):
+    diagnosis: _capped_text(200)
+    symptoms: _capped_text(300)
+    symptom_duration: _capped_text(60)
+    physical_exam_findings: _capped_text(300)
+
+
+class DiagnosticTests(BaseModel):
+    imaging: _capped_text(200)
+    labs: _capped_text(200)
+    other_tests: _capped_text(200)
+
+
+class Treatment(BaseModel):
+    procedure_performed: _capped_text(200)
+    procedure_planned: _capped_text(200)
+    medications: _capped_text(200)
+    conservative_treatments: _capped_text(200)
+
+
+class ClinicalAssessment(BaseModel):
+    severity: Severity
+    urgency: Urgency
+    prognosis: _capped_text(150)
+
+
+class ClinicalExtraction(BaseModel):
+    """Shape returned by extract_clinical_info_ollama (before 'meta')"""
+    patient_demographics: PatientDemographics = Field(default_factory=PatientDemographics)
+    clinical_information: ClinicalInformation = Field(default_factory=ClinicalInformation)
+    diagnostic_tests: DiagnosticTests = Field(default_factory=DiagnosticTests)
+    treatment: Treatment = Field(default_factory=Treatment)
+    clinical_assessment: ClinicalAssessment = Field(default_factory=ClinicalAssessment)
+
+
+class CaseExtraction(ClinicalExtraction):
+    """One entry of a multi-document extraction reply"""
+    case_id: str
+
+
+class BatchExtraction(BaseModel):
+    cases: List[CaseExtraction] = Field(default_factory=list)
+
+
+# --- Decision ---------------------------------------------------------------
+
+class Criterion(BaseModel):
+    criterion: _truncated(150)
+    status: CriterionStatus
+    evidence: _capped_text(300)
+
+
+class AuthorizationDecision(BaseModel):
+    """Shape returned by make_decision_ollama"""
+    decision: DecisionLabel
+    confidence: ConfidenceLabel
+    criteria_met: _capped_list(Criterion, 8)
+    reasoning: _truncated(1200)
+    missing_documentation: _capped_list(_truncated(150), 10)
+    recommendation: _capped_text(400)
+
+
+EXTRACTION_SCHEMA = ClinicalExtraction.model_json_schema()
+BATCH_EXTRACTION_SCHEMA = BatchExtraction.model_json_schema()
+DECISION_SCHEMA = AuthorizationDecision.model_json_schema()
+
+
+def _load_json(text):
+    return json.loads(text.replace('```json', '').replace('```', '').strip())
+
+
+def parse_extraction(text):
+    """Validate an extraction reply into a ClinicalExtraction"""
+    return ClinicalExtraction.model_validate(_load_json(text))
+
+
+def parse_batch_extraction(text):
+    """Validate a multi-document reply case by case
+
+    Returns {case_id: ClinicalExtraction}; entries that fail validation are
+    left out so the caller can retry them individually.
+    """
+    data = _load_json(text)
+    entries = data.get('cases', []) if isinstance(data, dict) else data
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            case = CaseExtraction.model_validate(entry)
+        except Exception:
+            continue
+        results[case.case_id] = ClinicalExtraction.model_validate(case.model_dump(exclude={'case_id'}))
+    return results
+
+
+def parse_decision(text):
+    """Validate a decision reply into an AuthorizationDecision"""
+    return AuthorizationDecision.model_validate(_load_json(text))
+
+
+def generation_stats(body):
+    """Token counts and timings reported by Ollama for one generate call"""
+    return {
+        'prompt_tokens': body.get('prompt_eval_count'),
+        'output_tokens': body.get('eval_count'),
+        'total_seconds': (body.get('total_duration') or 0) / 1e9,
+        'eval_seconds': (body.get('eval_duration') or 0) / 1e9
+    }
@@ -0,0 +1,367 @@
+"""
+Sharded Case Index
+Split the case index into N shards and scatter-gather searches across
+local worker processes or remote shard servers
+"""
+
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import threading
+
+import faiss
+import numpy as np
+
+from index_manifest import IndexIntegrityError, check_loaded, read_manifest, verify_directory, write_manifest
+from index_snapshots import new_version
+
+SHARDS_MANIFEST = "shards.json"
+SHARD_FILES = ["patient_cases.index", "metadata.json"]
+
+
+def shard_path(shard_root, shard_id):
+    return os.path.join(shard_root, f"shard_{shard_id:03d}")
+
+
+def write_shards(embeddings_array, metadata, shard_root, num_shards, model_name=None, source_sha256=None):
+    """Write contiguous shards, each with a FAISS index, metadata segment and manifest
+
+    The shards are built in a staging directory that replaces shard_root
+    whole, so shards of an earlier build never survive next to new ones.
+    Every shard and shards.json carry the same build_id; source_sha256 is
+    the checksum of the embeddings.npy the shards were split from.
+    """
+    total = len(metadata)
+    num_shards = max(1, min(num_shards, total))
+    bounds = np.linspace(0, total, num_shards + 1).astype(int)
+    build_id = new_version()
+
+    staging = f"{shard_root}.tmp-{build_id}"
+    os.makedirs(staging)
+    try:
+        shards = []
+        for shard_id in range(num_shards):
+            start, end = int(bounds[shard_id]), int(bounds[shard_id + 1])
+            path = shard_path(staging, shard_id)
+            os.makedirs(path)
+
+            index = faiss.IndexFlatIP(embeddings_array.shape[1])
+            index.add(embeddings_array[start:end])
+            faiss.write_index(index, os.path.join(path, "patient_cases.index"))
+            with open(os.path.join(path, "metadata.json"), 'w') as f:
+                json.dump({'build_id': build_id, 'offset': start, 'metadata': metadata[start:end]}, f)
+            write_manifest(path, index, end - start, SHARD_FILES, model_name)
+
+            shards.append({'shard_id': shard_id, 'offset': start, 'count': end - start})
+
+        with open(os.path.join(staging, SHARDS_MANIFEST), 'w') as f:
+            json.dump({
+                'build_id': build_id,
+                'source_sha256': source_sha256,
+                'num_shards': num_shards,
+                'total': total,
+                'dimension': int(embeddings_array.shape[1]),
+                'shards': shards
+            }, f, indent=2)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    remove_shards(shard_root)
+    os.rename(staging, shard_root)
+    return shards
+
+
+def remove_shards(shard_root):
+    """Delete shard_root, e.g. after a rebuild that no longer writes shards"""
+    if not os.path.exists(shard_root):
+        return False
+    # Rename first so a half-deleted directory is never mistaken for shards
+    retired = f"{shard_root}.old-{new_version()}"
+    os.rename(shard_root, retired)
+    shutil.rmtree(retired, ignore_errors=True)
+    return True
+
+
+class ShardSearcher:
+    """Searches one shard; returns global ids
+
+    Refuses a shard whose files don't match its manifest, or that belongs
+    to a different build than build_id (when given).
+    """
+
+    def __init__(self, path, build_id=None):
+        manifest = verify_directory(path)
+        self.index = faiss.read_index(os.path.join(path, "patient_cases.index"))
+        with open(os.path.join(path, "metadata.json"), 'r') as f:
+            segment = json.load(f)
+        self.build_id = segment.get('build_id')
+        self.offset = segment['offset']
+        self.metadata = segment['metadata']
+        check_loaded(self.index, self.metadata, manifest=manifest)
+        if build_id is not None and self.build_id != build_id:
+            raise IndexIntegrityError(f"{path}: shard from build {self.build_id}, expected {build_id}")
+
+    def search(self, query_vecs, k):
+        """Return one [(score, global_id, metadata)] list per query"""
+        query_vecs = np.asarray(query_vecs, dtype='float32').reshape(-1, self.index.d)
+        similarities, indices = self.index.search(query_vecs, k=min(k, self.index.ntotal))
+        results = []
+        for row_sims, row_ids in zip(similarities, indices):
+            results.append([
+                (float(sim), self.offset + int(idx), self.metadata[idx])
+                for idx, sim in zip(row_ids, row_sims)
+                if idx >= 0
+            ])
+        return results
+
+    def handle(self, request):
+        """Answer a protocol request (shared by process and TCP transports)
+
+        Failures are answered with {'error': ...} so the shard keeps serving.
+        """
+        try:
+            if request.get('op') == 'search':
+                return {'results': self.search(request['vectors'], request['k'])}
+            if request.get('op') == 'info':
+                return {'offset': self.offset, 'count': self.index.ntotal, 'build_id': self.build_id}
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+        return {'error': f"unknown op {request.get('op')}"}
+
+
+def read_shards_manifest(shard_root):
+    """shards.json, refused if the shards were split from another build of the index
+
+    Shards live in the index directory they were split from; when that
+    directory has a manifest, its embeddings.npy checksum must match.
+    """
+    with open(os.path.join(shard_root, SHARDS_MANIFEST), 'r') as f:
+        manifest = json.load(f)
+    source = read_manifest(os.path.dirname(os.path.normpath(shard_root)))
+    source_sha256 = manifest.get('source_sha256')
+    if source is not None and source_sha256:
+        current = source['files'].get('embeddings.npy', {}).get('sha256')
+        if current != source_sha256:
+            raise IndexIntegrityError(
+                f"{shard_root} is stale: split from a different build of the index "
+                f"(re-run create_embeddings.py --shards N)"
+            )
+    return manifest
+
+
+def check_shards(infos, manifest=None):
+    """Raise IndexIntegrityError unless the shards form one contiguous build
+
+    infos are the shards' 'info' responses, in shard order.
+    """
+    problems = []
+    build_ids = {info.get('build_id') for info in infos}
+    if len(build_ids) > 1:
+        problems.append(f"shards come from different builds: {sorted(map(str, build_ids))}")
+    offset = 0
+    for shard_id, info in enumerate(infos):
+        if info['offset'] != offset:
+            problems.append(f"shard {shard_id} starts at {info['offset']}, expected {offset}")
+        offset = info['offset'] + info['count']
+    if manifest is not None and offset != manifest['total']:
+        problems.append(f"shards hold {offset} vectors, {SHARDS_MANIFEST} says {manifest['total']}")
+    if problems:
+        raise IndexIntegrityError("; ".join(problems))
+
+
+def merge_topk(shard_results, k):
+    """Merge per-shard hit lists by score (ties broken by global id)"""
+    return heapq.nsmallest(
+        k,
+        (hit for hits in shard_results for hit in hits),
+        key=lambda hit: (-hit[0], hit[1])
+    )
+
+
+# --- Transports -----------------------------------------------------------
+#
+# Both transports exchange the same JSON-able request/response dicts.
+# send() and recv() are split so a search can be scattered to every shard
+# before waiting on any of them.
+
+def _process_shard_main(conn, path, build_id):
+    try:
+        searcher = ShardSearcher(path, build_id)
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+        conn.close()
+        return
+    conn.send({'ready': True})
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        conn.send(searcher.handle(request))
+    conn.close()
+
+
+class ProcessShard:
+    """Shard served by a local child process"""
+
+    def __init__(self, path, context, build_id=None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_process_shard_main, args=(child_conn, path, build_id), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        ready = self.conn.recv()
+        if 'error' in ready:
+            self.process.join(timeout=5)
+            raise IndexIntegrityError(ready['error'])
+
+    def send(self, request):
+        self.conn.send(request)
+
+    def recv(self):
+        return self.conn.recv()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+
+
+def _send_message(sock, payload):
+    data = json.dumps(payload).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("shard connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_message(sock):
+    (size,) = struct.unpack('>I', _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, size).decode('utf-8'))
+
+
+class RemoteShard:
+    """Shard served by a ShardServer (length-prefixed JSON over TCP)"""
+
+    def __init__(self, address, timeout=30):
+        host, port = address.rsplit(':', 1)
+        self.sock = socket.create_connection((host, int(port)), timeout=timeout)
+
+    def send(self, request):
+        _send_message(self.sock, request)
+
+    def recv(self):
+        return _recv_message(self.sock)
+
+    def close(self):
+        self.sock.close()
+
+
+class ShardServer(socketserver.ThreadingTCPServer):
+    """Serve one shard to RemoteShard clients"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, path):
+        self.searcher = ShardSearcher(path)
+        super().__init__(address, _ShardRequestHandler)
+
+
+class _ShardRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv_message(self.request)
+            except (ConnectionError, struct.error):
+                return
+            _send_message(self.request, self.server.searcher.handle(request))
+
+
+class ShardedCaseIndex:
+    """Scatter-gather search over shards in local processes or remote servers"""
+
+    def __init__(self, shard_root=None, servers=None):
+        self._lock = threading.Lock()
+        self.shards = []
+        manifest = None
+        try:
+            if servers:
+                self.shards = [RemoteShard(address) for address in servers]
+            else:
+                manifest = read_shards_manifest(shard_root)
+                context = multiprocessing.get_context('spawn')
+                for shard in manifest['shards']:
+                    self.shards.append(ProcessShard(
+                        shard_path(shard_root, shard['shard_id']), context, manifest.get('build_id')
+                    ))
+
+            for shard in self.shards:
+                shard.send({'op': 'info'})
+            infos = self._gather('info')
+            check_shards(infos, manifest)
+        except BaseException:
+            self.close()
+            raise
+        self.ntotal = sum(info['count'] for info in infos)
+
+    def search(self, query_vecs, k):
+        """Return one merged [(score, global_id, metadata)] list per query"""
+        query_vecs = np.asarray(query_vecs, dtype='float32')
+        request = {'op': 'search', 'vectors': query_vecs.tolist(), 'k': k}
+        with self._lock:
+            for shard in self.shards:
+                shard.send(request)
+            responses = [reply['results'] for reply in self._gather('search')]
+
+        return [
+            merge_topk([shard_hits[q] for shard_hits in responses], k)
+            for q in range(len(query_vecs))
+        ]
+
+    def _gather(self, op):
+        """One reply per shard (all are read, keeping the streams in step); raises on errors"""
+        replies = [shard.recv() for shard in self.shards]
+        errors = [f"shard {shard_id}: {reply['error']}" for shard_id, reply in enumerate(replies) if 'error' in reply]
+        if errors:
+            raise RuntimeError(f"{op} failed on " + "; ".join(errors))
+        return replies
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one case index shard over TCP")
+    parser.add_argument('shard', help="Shard directory, e.g. data/embeddings/shards/shard_000")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    args = parser.parse_args()
+
+    server = ShardServer((args.host, args.port), args.shard)
+    print(f" Serving {args.shard} on {args.host}:{args.port} "
+          f"({server.searcher.index.ntotal} vectors)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+In-Flight Request Coalescing (singleflight)
+Concurrent callers with the same fingerprint share one computation
+"""
+
+import asyncio
+import copy
+import hashlib
+import threading
+
+from embedding_cache import normalize_query_text
+
+
+def request_fingerprint(*parts):
+    """Stable key for a request from its (whitespace/case-normalized) parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(normalize_query_text(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based coalescing: one leader computes, followers wait for it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.executions = 0
+        self.collapsed = 0
+
+    def do(self, key, func):
+        """Return func() for key, sharing the result with concurrent callers"""
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self.collapsed += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if leader:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        # Followers get their own copy so callers can't mutate each other's result
+        return copy.deepcopy(call.result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'executions': self.executions,
+                'collapsed': self.collapsed,
+                'in_flight': len(self._calls)
+            }
+
+
+class AsyncSingleFlight:
+    """asyncio coalescing: followers await the leader's task"""
+
+    def __init__(self):
+        self._tasks = {}
+        self.requests = 0
+        self.executions = 0
+        self.collapsed = 0
+
+    async def do(self, key, coro_func):
+        """Await coro_func() for key, sharing the result with concurrent callers"""
+        self.requests += 1
+        task = self._tasks.get(key)
+        if task is not None:
+            self.collapsed += 1
+            # shield: a cancelled follower must not cancel the shared call
+            return copy.deepcopy(await asyncio.shield(task))
+
+        self.executions += 1
+        task = asyncio.ensure_future(coro_func())
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'executions': self.executions,
+            'collapsed': self.collapsed,
+            'in_flight': len(self._tasks)
+        }
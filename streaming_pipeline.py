@@ -0,0 +1,282 @@
+"""
+Fused Extraction -> Embedding Pipeline
+Extracted cases go through a bounded queue into a micro-batched encoder
+and are appended to a live index, published as snapshots as they
+arrive instead of after the whole extraction run
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from index_files import (
+    EMBEDDING_MODEL, MIN_TEXT_LENGTH, case_embedding_text, case_metadata_record, write_index_files
+)
+from index_manifest import check_loaded, verify_directory
+from index_snapshots import link_files, publish_snapshot
+from lexical_index import LexicalIndex, case_lexical_text
+
+EMBEDDINGS_DIR = "data/embeddings"
+_STOP = object()
+
+
+class LiveCaseIndex:
+    """Append-only FAISS index, metadata and lexical index behind one lock
+
+    Resumes from the files in output_dir when they exist. search() and
+    reconstruct_batch() match the FAISS calls PriorAuthSystemOllama makes,
+    so the live index can be passed in as case_index.
+    """
+
+    def __init__(self, output_dir=EMBEDDINGS_DIR, dimension=384):
+        self.output_dir = output_dir
+        self.dimension = dimension
+        self._lock = threading.RLock()
+        self.index = faiss.IndexFlatIP(dimension)
+        self.metadata = []
+        self.lexical_index = LexicalIndex()
+        self._vectors = []
+
+        embeddings_path = os.path.join(output_dir, "embeddings.npy")
+        metadata_path = os.path.join(output_dir, "metadata.json")
+        lexical_path = os.path.join(output_dir, "lexical_index.json")
+        if os.path.exists(embeddings_path) and os.path.exists(metadata_path):
+            manifest = verify_directory(output_dir)
+            vectors = np.load(embeddings_path).astype('float32')
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            lexical = LexicalIndex.load(lexical_path) if os.path.exists(lexical_path) else LexicalIndex()
+            self.index = faiss.IndexFlatIP(vectors.shape[1])
+            self.index.add(vectors)
+            # Appending to mismatched files would shift every later case id
+            check_loaded(self.index, metadata, lexical, manifest=manifest, model_name=EMBEDDING_MODEL)
+            self.metadata = metadata
+            self.lexical_index = lexical
+            self._vectors = [vectors]
+
+        self.case_ids = {record['case_id'] for record in self.metadata}
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def append(self, vectors, records, lexical_texts):
+        with self._lock:
+            self.index.add(vectors)
+            self._vectors.append(vectors)
+            self.metadata.extend(records)
+            for text in lexical_texts:
+                self.lexical_index.add(text)
+            self.case_ids.update(record['case_id'] for record in records)
+
+    def search(self, query_vecs, k):
+        with self._lock:
+            return self.index.search(query_vecs, k)
+
+    def reconstruct_batch(self, ids):
+        with self._lock:
+            return self.index.reconstruct_batch(ids)
+
+    def checkpoint(self, final=False):
+        """Publish the current state as a snapshot so running systems swap it in
+
+        final=True also writes the top-level files in output_dir (the ones
+        a restart resumes from) and links the snapshot to them;
+        micro-checkpoints skip them. Either way the index is written once.
+        """
+        with self._lock:
+            if not self.metadata:
+                return None
+            os.makedirs(self.output_dir, exist_ok=True)
+            vectors = np.vstack(self._vectors)
+            self._vectors = [vectors]
+            snapshots = os.path.join(self.output_dir, "snapshots")
+            if final:
+                paths = write_index_files(self.output_dir, vectors, self.metadata, self.lexical_index,
+                                          index=self.index)
+                publish_snapshot(link_files(self.output_dir), root=snapshots)
+                return paths
+            version = publish_snapshot(
+                lambda snapshot_dir: write_index_files(
+                    snapshot_dir, vectors, self.metadata, self.lexical_index, index=self.index
+                ),
+                root=snapshots
+            )
+            return {'snapshot': os.path.join(snapshots, version)}
+
+
+class StreamingIndexer:
+    """Background encoder fed by a bounded queue
+
+    submit() blocks while the queue is full, so extraction can't outrun the
+    encoder. The encoder takes up to batch_size cases, waiting at most
+    max_wait seconds to fill a batch. A checkpoint is due after
+    checkpoint_every new cases (or checkpoint_growth of the index, if more,
+    so a checkpoint costs O(N) amortized), or once max_checkpoint_interval
+    seconds have passed with new cases pending. close() drains the queue
+    and writes a final checkpoint.
+    """
+
+    def __init__(self, live_index, model, batch_size=32, max_wait=0.5, queue_size=128, checkpoint_every=256,
+                 checkpoint_growth=0.1, max_checkpoint_interval=60):
+        self.live_index = live_index
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_growth = checkpoint_growth
+        self.max_checkpoint_interval = max_checkpoint_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {
+            'submitted': 0,
+            'indexed': 0,
+            'skipped': 0,
+            'errors': 0,
+            'batches': 0,
+            'checkpoints': 0,
+            'backpressure_seconds': 0.0,
+            'encode_seconds': 0.0
+        }
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="streaming-indexer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, case, filename):
+        """Queue a processed case; False if it is already indexed or too short"""
+        case_id = case.get('meta', {}).get('case_id')
+        text = case_embedding_text(case)
+        if case_id in self.live_index.case_ids or len(text) < MIN_TEXT_LENGTH:
+            self.stats['skipped'] += 1
+            return False
+
+        start = time.perf_counter()
+        self.queue.put((text, case_metadata_record(case, filename), case_lexical_text(case)))
+        self.stats['backpressure_seconds'] += time.perf_counter() - start
+        self.stats['submitted'] += 1
+        return True
+
+    def backfill(self, processed_dir):
+        """Queue processed case files that aren't in the index yet"""
+        if not os.path.exists(processed_dir):
+            return 0
+        queued = 0
+        for filename in sorted(f for f in os.listdir(processed_dir) if f.endswith('.json')):
+            if filename.replace('.json', '') in self.live_index.case_ids:
+                continue
+            try:
+                with open(os.path.join(processed_dir, filename), 'r') as f:
+                    case = json.load(f)
+            except (OSError, ValueError):
+                continue
+            queued += self.submit(case, filename)
+        return queued
+
+    def _checkpoint_wait(self):
+        """Seconds until a pending time-based checkpoint is due (None: nothing pending)"""
+        if not self._since_checkpoint or not self.max_checkpoint_interval:
+            return None
+        return max(0.0, self._last_checkpoint + self.max_checkpoint_interval - time.monotonic())
+
+    def _checkpoint_due(self):
+        threshold = max(self.checkpoint_every, self.checkpoint_growth * len(self.live_index))
+        return self._since_checkpoint >= threshold or self._checkpoint_wait() == 0
+
+    def _next_batch(self):
+        """Wait for one item, then gather more until full or max_wait; (batch, stop)
+
+        Returns an empty batch when a time-based checkpoint falls due first.
+        """
+        try:
+            item = self.queue.get(timeout=self._checkpoint_wait())
+        except queue.Empty:
+            return [], False
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if not batch:
+                if not stop and self._checkpoint_due():
+                    self._checkpoint()
+                continue
+            try:
+                start = time.perf_counter()
+                vectors = self.model.encode(
+                    [text for text, _, _ in batch], batch_size=len(batch), normalize_embeddings=True
+                )
+                self.stats['encode_seconds'] += time.perf_counter() - start
+                self.live_index.append(
+                    np.asarray(vectors, dtype='float32'),
+                    [record for _, record, _ in batch],
+                    [lexical for _, _, lexical in batch]
+                )
+            except Exception as e:
+                print(f"\n Streaming indexer error ({len(batch)} cases dropped): {e}")
+                self.stats['errors'] += len(batch)
+                continue
+            self.stats['indexed'] += len(batch)
+            self.stats['batches'] += 1
+            self._since_checkpoint += len(batch)
+            if self._checkpoint_due():
+                self._checkpoint()
+
+    def _checkpoint(self, final=False):
+        if self.live_index.checkpoint(final=final) is not None:
+            self.stats['checkpoints'] += 1
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        """Flush queued cases, stop the encoder and write a final checkpoint"""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._checkpoint(final=True)
+        return dict(self.stats, total_indexed=len(self.live_index))
+
+
+def start_streaming_indexer(output_dir=EMBEDDINGS_DIR, processed_dir=None, **options):
+    """Load the encoder and live index; optionally backfill unindexed case files"""
+    from sentence_transformers import SentenceTransformer
+    from thread_budget import ThreadBudget
+
+    ThreadBudget.from_env().apply()
+    live_index = LiveCaseIndex(output_dir)
+    indexer = StreamingIndexer(live_index, SentenceTransformer(EMBEDDING_MODEL), **options)
+    print(f" Streaming indexer ready ({len(live_index)} cases already indexed)")
+    if processed_dir:
+        backfilled = indexer.backfill(processed_dir)
+        if backfilled:
+            print(f" Backfilling {backfilled} processed cases missing from the index")
+    return indexer
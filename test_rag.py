@@ -7,6 +7,9 @@ import faiss
 import json
 import numpy as np
 import os
+from pipeline_profiler import profile_run
+from thread_budget import ThreadBudget
+from index_manifest import IndexIntegrityError, check_loaded, verify_directory
 
 def test_rag():
     """Test the RAG system with sample queries"""
@@ -21,18 +24,29 @@ def test_rag():
         print("   Run: python create_embeddings.py")
         return
     
+    # PRIOR_AUTH_THREADS / PRIOR_AUTH_FAISS_THREADS / PRIOR_AUTH_CPUS
+    ThreadBudget.from_env().apply()
+    
     # Load model
     print("\n📥 Loading model...")
     model = SentenceTransformer('all-MiniLM-L6-v2')
     
     # Load index
     print("📥 Loading FAISS index...")
-    index = faiss.read_index("data/embeddings/patient_cases.index")
-    
-    # Load metadata
-    print("📥 Loading metadata...")
-    with open("data/embeddings/metadata.json", 'r') as f:
-        metadata = json.load(f)
+    try:
+        manifest = verify_directory("data/embeddings")
+        index = faiss.read_index("data/embeddings/patient_cases.index")
+        
+        # Load metadata
+        print("📥 Loading metadata...")
+        with open("data/embeddings/metadata.json", 'r') as f:
+            metadata = json.load(f)
+        
+        check_loaded(index, metadata, manifest=manifest, model_name='all-MiniLM-L6-v2')
+    except IndexIntegrityError as e:
+        print(f"\n❌ Index files are inconsistent: {e}")
+        print("   Run: python create_embeddings.py")
+        return
     
     print(f"✅ Loaded {index.ntotal} patient cases")
     
@@ -71,4 +85,5 @@ def test_rag():
     print("=" * 70)
 
 if __name__ == "__main__":
-    test_rag()
+    with profile_run('test_rag'):
+        test_rag()
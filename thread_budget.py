@@ -0,0 +1,151 @@
+"""
+CPU Thread Budget
+One place to cap torch and FAISS threads (and optionally pin CPUs) per
+process, so co-located extractors, embedders and decision workers don't
+oversubscribe the machine
+"""
+
+import os
+
+THREADS_ENV = "PRIOR_AUTH_THREADS"
+INTEROP_THREADS_ENV = "PRIOR_AUTH_INTEROP_THREADS"
+FAISS_THREADS_ENV = "PRIOR_AUTH_FAISS_THREADS"
+CPUS_ENV = "PRIOR_AUTH_CPUS"
+
+# Native thread pools read these when they start; torch/MKL/OpenBLAS may
+# spin up before set_num_threads() is called
+NATIVE_THREAD_ENVS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def parse_cpu_list(spec):
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    cpus = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _env_int(name):
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else None
+
+
+class ThreadBudget:
+    """Threads for torch (intra/inter-op) and FAISS, plus optional CPU pinning
+
+    Unset fields leave the library defaults alone. faiss_threads defaults
+    to threads; with cpus set and threads unset, threads = len(cpus).
+    """
+
+    def __init__(self, threads=None, interop_threads=None, faiss_threads=None, cpus=None):
+        if isinstance(cpus, str):
+            cpus = parse_cpu_list(cpus)
+        self.cpus = list(cpus) if cpus else None
+        self.threads = threads or (len(self.cpus) if self.cpus else None)
+        self.interop_threads = interop_threads
+        self.faiss_threads = faiss_threads or self.threads
+
+    @classmethod
+    def from_env(cls):
+        cpus = os.environ.get(CPUS_ENV, '').strip()
+        return cls(
+            threads=_env_int(THREADS_ENV),
+            interop_threads=_env_int(INTEROP_THREADS_ENV),
+            faiss_threads=_env_int(FAISS_THREADS_ENV),
+            cpus=parse_cpu_list(cpus) if cpus else None
+        )
+
+    @classmethod
+    def from_args(cls, args):
+        """From add_thread_arguments() options, falling back to the environment"""
+        cpus = args.cpus or os.environ.get(CPUS_ENV, '').strip()
+        return cls(
+            threads=args.threads or _env_int(THREADS_ENV),
+            interop_threads=args.interop_threads or _env_int(INTEROP_THREADS_ENV),
+            faiss_threads=args.faiss_threads or _env_int(FAISS_THREADS_ENV),
+            cpus=parse_cpu_list(cpus) if cpus else None
+        )
+
+    def is_default(self):
+        return not (self.threads or self.interop_threads or self.faiss_threads or self.cpus)
+
+    def apply(self):
+        """Apply to the current process; returns what was actually set"""
+        applied = {}
+        if self.cpus and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.cpus)
+            applied['cpus'] = self.cpus
+
+        if self.threads:
+            for name in NATIVE_THREAD_ENVS:
+                os.environ[name] = str(self.threads)
+
+        torch = None
+        if self.threads or self.interop_threads:
+            try:
+                import torch
+            except ImportError:
+                pass
+        if torch is not None and self.threads:
+            torch.set_num_threads(self.threads)
+            applied['torch_threads'] = self.threads
+        if torch is not None and self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+                applied['torch_interop_threads'] = self.interop_threads
+            except RuntimeError:
+                # Only settable before torch runs its first parallel op
+                pass
+
+        if self.faiss_threads:
+            import faiss
+            faiss.omp_set_num_threads(self.faiss_threads)
+            applied['faiss_threads'] = self.faiss_threads
+        return applied
+
+    def describe(self):
+        if self.is_default():
+            return "library defaults"
+        parts = []
+        if self.threads:
+            parts.append(f"torch {self.threads}")
+        if self.interop_threads:
+            parts.append(f"inter-op {self.interop_threads}")
+        if self.faiss_threads:
+            parts.append(f"faiss {self.faiss_threads}")
+        if self.cpus:
+            parts.append(f"cpus {','.join(str(c) for c in self.cpus)}")
+        return ", ".join(parts)
+
+
+def split_cpus(workers, threads_per_worker, cpus=None):
+    """Disjoint CPU sets for co-located workers (round-robin if oversubscribed)"""
+    cpus = cpus or available_cpus()
+    return [
+        [cpus[(worker * threads_per_worker + i) % len(cpus)] for i in range(threads_per_worker)]
+        for worker in range(workers)
+    ]
+
+
+def add_thread_arguments(parser):
+    """Add --threads/--interop-threads/--faiss-threads/--cpus to a parser"""
+    parser.add_argument('--threads', type=int, default=None, help=f"torch threads (or {THREADS_ENV})")
+    parser.add_argument('--interop-threads', type=int, default=None,
+                        help=f"torch inter-op threads (or {INTEROP_THREADS_ENV})")
+    parser.add_argument('--faiss-threads', type=int, default=None,
+                        help=f"FAISS OpenMP threads (or {FAISS_THREADS_ENV})")
+    parser.add_argument('--cpus', default=None, help=f"Pin to CPUs, e.g. 0-3 (or {CPUS_ENV})")
@@ -0,0 +1,408 @@
+"""
+Decision Traffic Record/Replay
+Records every decision request (inputs, retrieved cases, policy, raw
+Ollama replies, timings) to an append-only JSONL file, and replays a
+recording against a local stub that serves the recorded replies
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ollama_pool import OllamaPool, get_pool
+from ollama_stub import OllamaStub
+from singleflight import request_fingerprint
+
+RECORD_PATH = "data/traffic/decisions.jsonl"
+
+# build_decision_prompt() layout: the request is recoverable from the prompt
+PROMPT_REQUEST = re.compile(r"PATIENT CASE:\n(.*?)\n\nPROCEDURE: (.*?)\n\nPOLICY:\n", re.S)
+
+
+def short_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def recorder_from_env():
+    """TrafficRecorder for PRIOR_AUTH_RECORD (a path, or 1/on for the default), else None"""
+    value = os.getenv('PRIOR_AUTH_RECORD', '').strip()
+    if not value or value.lower() in ('0', 'off', 'false', 'no'):
+        return None
+    return TrafficRecorder(RECORD_PATH if value.lower() in ('1', 'on', 'true', 'yes') else value)
+
+
+def decision_summary(decision):
+    if not decision:
+        return None
+    return {
+        'decision': decision.get('decision'),
+        'confidence': decision.get('confidence'),
+        'model': (decision.get('decided_by') or {}).get('model')
+    }
+
+
+class CapturingPool:
+    """Wraps an OllamaPool and keeps every reply (without the token context) with its latency"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.calls = []
+
+    def _record(self, payload, start, body=None, error=None):
+        call = {'model': payload.get('model'), 'latency': round(time.perf_counter() - start, 4)}
+        if error is None:
+            call['body'] = {key: value for key, value in body.items() if key != 'context'}
+        else:
+            call['error'] = str(error)
+        self.calls.append(call)
+
+    def generate(self, payload, timeout=120):
+        start = time.perf_counter()
+        try:
+            body = self.pool.generate(payload, timeout=timeout)
+        except Exception as e:
+            self._record(payload, start, error=e)
+            raise
+        self._record(payload, start, body)
+        return body
+
+    async def agenerate(self, payload, timeout=120):
+        start = time.perf_counter()
+        try:
+            body = await self.pool.agenerate(payload, timeout=timeout)
+        except Exception as e:
+            self._record(payload, start, error=e)
+            raise
+        self._record(payload, start, body)
+        return body
+
+
+class TrafficRecorder:
+    """One compact JSON line per decision request, appended to path
+
+    Lines are written with a single O_APPEND write, so pre-fork workers can
+    share a file. path=None keeps entries in memory (used by the replayer).
+    Requests coalesced onto an identical in-flight one are recorded with
+    coalesced=true and no Ollama calls. Every record()/arecord() gets its
+    own call id, and only the call whose evaluation ran stores a trace
+    under it, so identical requests never take each other's trace.
+    """
+
+    def __init__(self, path=RECORD_PATH):
+        self.path = path
+        self.entries = []
+        self._traces = {}
+        self._call_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._fd = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def write(self, entry):
+        if self._fd is None:
+            with self._lock:
+                self.entries.append(entry)
+            return
+        data = (json.dumps(entry, separators=(',', ':')) + "\n").encode('utf-8')
+        with self._lock:
+            while data:
+                data = data[os.write(self._fd, data):]
+
+    def _trace(self, call_id, similar_cases, policy, prompt, retrieval_seconds, capture, start, error):
+        if call_id is None:
+            return
+        self._traces[call_id] = {
+            'case_ids': [case['case_id'] for case in similar_cases],
+            'policy_hash': short_hash(policy),
+            'prompt_hash': short_hash(prompt),
+            'calls': capture.calls,
+            'timings': {'retrieval': round(retrieval_seconds, 4), 'llm': round(time.perf_counter() - start, 4)},
+            'error': error
+        }
+
+    def trace(self, call_id, similar_cases, policy, prompt, retrieval_seconds, run, pool=None):
+        """Run run(pool) for the evaluating call (id from record()), capturing its Ollama calls"""
+        capture = CapturingPool(pool or get_pool())
+        start = time.perf_counter()
+        error = None
+        try:
+            return run(capture)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._trace(call_id, similar_cases, policy, prompt, retrieval_seconds, capture, start, error)
+
+    async def atrace(self, call_id, similar_cases, policy, prompt, retrieval_seconds, run, pool=None):
+        capture = CapturingPool(pool or get_pool())
+        start = time.perf_counter()
+        error = None
+        try:
+            return await run(capture)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._trace(call_id, similar_cases, policy, prompt, retrieval_seconds, capture, start, error)
+
+    def _entry(self, key, call_id, patient_document, procedure_requested, arrived, start, decision):
+        entry = {
+            't': round(arrived, 4),
+            'id': key[:16],
+            'patient_document': patient_document,
+            'procedure_requested': procedure_requested,
+            'latency': round(time.perf_counter() - start, 4),
+            'decision': decision_summary(decision)
+        }
+        trace = self._traces.pop(call_id, None)
+        if trace is None:
+            entry['coalesced'] = True
+        else:
+            entry.update(trace)
+        return entry
+
+    def record(self, key, patient_document, procedure_requested, run):
+        """Run run(call_id) (the coalesced decision) and append its entry
+
+        run passes call_id on to trace() if its evaluation is the one that runs.
+        """
+        call_id = next(self._call_ids)
+        arrived, start = time.time(), time.perf_counter()
+        try:
+            decision = run(call_id)
+        except BaseException:
+            self._traces.pop(call_id, None)
+            raise
+        self.write(self._entry(key, call_id, patient_document, procedure_requested, arrived, start, decision))
+        return decision
+
+    async def arecord(self, key, patient_document, procedure_requested, run):
+        call_id = next(self._call_ids)
+        arrived, start = time.time(), time.perf_counter()
+        try:
+            decision = await run(call_id)
+        except BaseException:
+            self._traces.pop(call_id, None)
+            raise
+        self.write(self._entry(key, call_id, patient_document, procedure_requested, arrived, start, decision))
+        return decision
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def load_recording(path):
+    """Entries of a recording in arrival order (a torn last line is ignored)"""
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    entries.sort(key=lambda entry: entry['t'])
+    return entries
+
+
+class ReplayResponder:
+    """Serves recorded Ollama replies by (request, model)
+
+    The request is parsed out of the prompt, so replies still match when a
+    change alters retrieval or policy text. Unknown requests get an empty
+    reply, which fails decision parsing, and are counted as misses.
+    """
+
+    def __init__(self, entries, speed=1.0):
+        self.speed = speed
+        self.replies = {}
+        self.misses = 0
+        for entry in entries:
+            key = request_fingerprint(entry['patient_document'], entry['procedure_requested'])
+            for call in entry.get('calls') or []:
+                if 'body' in call:
+                    self.replies.setdefault((key, call['model']), call)
+
+    def _lookup(self, payload):
+        match = PROMPT_REQUEST.search(payload.get('prompt', ''))
+        if not match:
+            return None
+        return self.replies.get((request_fingerprint(match.group(1), match.group(2)), payload.get('model')))
+
+    def latency(self, payload):
+        call = self._lookup(payload)
+        if call is None or not self.speed:
+            return 0.0
+        return call['latency'] / self.speed
+
+    def __call__(self, payload):
+        call = self._lookup(payload)
+        if call is None:
+            self.misses += 1
+            return "{}"
+        return dict(call['body'])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def replay(system, entries, speed=1.0, mode='threads', concurrency=8):
+    """Send recorded requests at their recorded offsets / speed (0 = all at once)
+
+    mode 'threads' calls system.decide() from a thread pool, 'async' awaits
+    system.amake_decision_ollama(). Returns (results, wall_seconds) where
+    results are (entry, decision, seconds from scheduled arrival to done).
+    """
+    t0 = entries[0]['t'] if entries else 0.0
+    offsets = [(entry['t'] - t0) / speed if speed else 0.0 for entry in entries]
+
+    if mode == 'async':
+        async def run_all():
+            start = time.perf_counter()
+
+            async def one(entry, offset):
+                await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+                decision = await system.amake_decision_ollama(entry['patient_document'], entry['procedure_requested'])
+                return entry, decision, time.perf_counter() - start - offset
+
+            results = await asyncio.gather(*(one(e, o) for e, o in zip(entries, offsets)))
+            return results, time.perf_counter() - start
+        return asyncio.run(run_all())
+
+    def one(entry, offset, start):
+        decision = system.decide(entry['patient_document'], entry['procedure_requested'])
+        return entry, decision, time.perf_counter() - start - offset
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        futures = []
+        for entry, offset in zip(entries, offsets):
+            time.sleep(max(0.0, start + offset - time.perf_counter()))
+            futures.append(executor.submit(one, entry, offset, start))
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def find_divergences(recorded, replayed_traces, results):
+    """Requests whose decision, retrieved cases or policy differ from the recording"""
+    reference = {}
+    for entry in recorded:
+        if not entry.get('coalesced'):
+            reference.setdefault(entry['id'], entry)
+    replay_reference = {}
+    for entry in replayed_traces:
+        if not entry.get('coalesced'):
+            replay_reference.setdefault(entry['id'], entry)
+
+    divergences = []
+    for entry, decision, _ in results:
+        expected = reference.get(entry['id'])
+        if expected is None:
+            continue
+        problems = []
+        if decision_summary(decision) != expected['decision']:
+            problems.append(f"decision {expected['decision']} -> {decision_summary(decision)}")
+        trace = replay_reference.get(entry['id'])
+        if trace is not None:
+            if trace['case_ids'] != expected['case_ids']:
+                problems.append(f"cases {expected['case_ids']} -> {trace['case_ids']}")
+            if trace['policy_hash'] != expected['policy_hash']:
+                problems.append("policy changed")
+        if problems:
+            divergences.append({'id': entry['id'], 'procedure': entry['procedure_requested'], 'problems': problems})
+    return divergences
+
+
+def main():
+    from prior_auth_ollama import PriorAuthSystemOllama
+
+    parser = argparse.ArgumentParser(description="Replay recorded decision traffic against a stub Ollama")
+    parser.add_argument('recording', nargs='?', default=RECORD_PATH)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Arrival and LLM latency speed-up (1 = original, 0 = no waiting)")
+    parser.add_argument('--mode', choices=['threads', 'async'], default='threads')
+    parser.add_argument('--concurrency', type=int, default=8, help="Threads for --mode threads")
+    parser.add_argument('--limit', type=int, default=None, help="Replay only the first N requests")
+    parser.add_argument('--report', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    entries = load_recording(args.recording)[:args.limit]
+    if not entries:
+        print(f" No recorded requests in {args.recording}")
+        print("   Record with PRIOR_AUTH_RECORD=1 python prior_auth_ollama.py (or prefork_server.py)")
+        return
+
+    responder = ReplayResponder(entries, speed=args.speed)
+    stub = OllamaStub(responder=responder, latency=responder.latency).start()
+    replay_recorder = TrafficRecorder(path=None)
+    system = PriorAuthSystemOllama(ollama_pool=OllamaPool([stub.url]), recorder=replay_recorder,
+                                   cpu_workers=args.concurrency)
+
+    print("\n" + "=" * 70)
+    print("TRAFFIC REPLAY")
+    print("=" * 70)
+    span = entries[-1]['t'] - entries[0]['t']
+    print(f" {len(entries)} requests recorded over {span:.1f}s, replaying at "
+          f"{'full speed' if not args.speed else f'{args.speed:g}x'} ({args.mode})")
+
+    try:
+        results, wall_seconds = replay(system, entries, args.speed, args.mode, args.concurrency)
+    finally:
+        system.close()
+        stub.stop()
+
+    recorded_latencies = [entry['latency'] for entry in entries]
+    replay_latencies = [latency for _, _, latency in results]
+    recorded_calls = sum(len(entry.get('calls') or []) for entry in entries)
+    divergences = find_divergences(entries, replay_recorder.entries, results)
+    report = {
+        'recording': args.recording,
+        'requests': len(entries),
+        'speed': args.speed,
+        'mode': args.mode,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput': round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        'recorded_throughput': round(len(entries) / span, 2) if span else None,
+        'latency': {
+            name: {f"p{int(p * 100)}": percentile(values, p) for p in (0.5, 0.95, 0.99)}
+            for name, values in (('recorded', recorded_latencies), ('replay', replay_latencies))
+        },
+        'llm_calls': {'recorded': recorded_calls, 'replay': stub.requests, 'unmatched': responder.misses},
+        'coalesced': sum(1 for entry in replay_recorder.entries if entry.get('coalesced')),
+        'divergences': divergences
+    }
+
+    print(f"\n Throughput: {report['throughput']} req/s (recorded {report['recorded_throughput']} req/s)")
+    print(f"\n{'Latency (s)':<14} {'p50':>10} {'p95':>10} {'p99':>10}")
+    print("-" * 70)
+    for name, values in report['latency'].items():
+        print(f"{name:<14} " + " ".join(f"{values[p] or 0:>10.3f}" for p in ('p50', 'p95', 'p99')))
+    print("-" * 70)
+    print(f" LLM calls: {stub.requests} (recorded {recorded_calls}, {responder.misses} without a recorded reply)")
+    print(f" Coalesced requests: {report['coalesced']}")
+    print(f" Divergences: {len(divergences)}")
+    for divergence in divergences[:10]:
+        print(f"   {divergence['id']} {divergence['procedure']}: {'; '.join(divergence['problems'])}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n Report saved to: {args.report}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Section-Aware Transcription Trimming
+Split MTSamples transcriptions on their uppercase headings and keep the
+sections that matter for extraction within a token budget
+"""
+
+import math
+import re
+
+# Default prompt budget for the transcription part of the extraction prompt
+TRANSCRIPTION_TOKEN_BUDGET = 1000
+
+# MTSamples headings: "PREOPERATIVE DIAGNOSIS:, ..." at the start or after
+# punctuation/whitespace
+HEADING_PATTERN = re.compile(r"(?:^|(?<=[\s,.;]))([A-Z][A-Z0-9 /&()'-]{2,60}):")
+
+# (pattern, score), first match wins; boilerplate is checked before the
+# broad clinical terms so "DESCRIPTION OF PROCEDURE" doesn't rank as PROCEDURE
+SECTION_SCORES = [
+    (r'DESCRIPTION OF|DETAILS OF|TECHNIQUE|OPERATIVE NOTE|ANESTHESIA|BLOOD LOSS|'
+     r'SPECIMEN|FLUIDS|DRAINS|COMPLICATIONS|DISPOSITION|CONDITION', 1),
+    (r'DIAGNOS|IMPRESSION|ASSESSMENT', 10),
+    (r'PROCEDURE|OPERATION|PLAN|INDICATION|RECOMMENDATION', 9),
+    (r'CHIEF COMPLAINT|PRESENT ILLNESS|HPI|REASON|SUBJECTIVE|HISTORY$', 8),
+    (r'EXAM|FINDINGS|NEURO|OBJECTIVE|VITAL', 6),
+    (r'IMAGING|RADIOLOG|MRI|CT |X-RAY|XRAY|LAB|RESULT|STUDIES|DATA', 6),
+    (r'MEDICATION|ALLERG|TREATMENT|THERAPY', 4),
+    (r'PAST|SOCIAL|FAMILY|REVIEW OF SYSTEMS|ROS', 2),
+]
+
+PREAMBLE_SCORE = 5
+DEFAULT_SCORE = 3
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English clinical text)"""
+    return math.ceil(len(text) / 4)
+
+
+def split_sections(text):
+    """Return [(heading or None, body)] in document order"""
+    text = str(text)
+    matches = list(HEADING_PATTERN.finditer(text))
+    if not matches:
+        return [(None, text.strip())]
+
+    sections = []
+    preamble = text[:matches[0].start()].strip(' ,')
+    if preamble:
+        sections.append((None, preamble))
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        body = text[match.end():end].strip(' ,')
+        sections.append((match.group(1).strip(), body))
+    return sections
+
+
+def section_score(heading):
+    """Relevance of a section to the extraction fields"""
+    if heading is None:
+        return PREAMBLE_SCORE
+    for pattern, score in SECTION_SCORES:
+        if re.search(pattern, heading):
+            return score
+    return DEFAULT_SCORE
+
+
+def format_section(heading, body):
+    return f"{heading}: {body}" if heading else body
+
+
+def trim_transcription(text, token_budget=TRANSCRIPTION_TOKEN_BUDGET):
+    """Keep the most relevant sections within token_budget, in document order
+
+    Text that already fits is returned unchanged. The highest-ranked section
+    that does not fit is truncated to the remaining budget.
+    """
+    text = str(text)
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    sections = split_sections(text)
+    ranked = sorted(
+        range(len(sections)),
+        key=lambda i: (-section_score(sections[i][0]), i)
+    )
+
+    kept = {}
+    remaining = token_budget
+    for i in ranked:
+        chunk = format_section(*sections[i])
+        cost = estimate_tokens(chunk) + 1
+        if cost <= remaining:
+            kept[i] = chunk
+            remaining -= cost
+        elif remaining > 25:
+            kept[i] = chunk[:(remaining - 1) * 4].rsplit(' ', 1)[0] + " ..."
+            remaining = 0
+        if remaining <= 0:
+            break
+
+    return "\n".join(kept[i] for i in sorted(kept))
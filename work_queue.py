@@ -0,0 +1,242 @@
+"""
+Durable Work Queue (SQLite)
+Lets several extraction workers share one backlog with time-limited leases
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+QUARANTINED = 'quarantined'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    case_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS cases_status ON cases (status, position);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """SQLite-backed queue of cases with leases
+
+    Life cycle: queued -> leased -> done. A failed attempt goes back to
+    queued until max_attempts, then to failed. A lease that expires (the
+    worker crashed or hung) is re-queued; a case whose lease expired
+    max_attempts times is quarantined so it cannot keep killing workers.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+    def seed(self, items):
+        """Add (case_id, payload) pairs; existing case ids are left alone"""
+        added = 0
+        with self._transaction():
+            position = self.conn.execute("SELECT COALESCE(MAX(position), -1) FROM cases").fetchone()[0]
+            for case_id, payload in items:
+                position += 1
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO cases (case_id, position, payload, updated_at) VALUES (?, ?, ?, ?)",
+                    (case_id, position, json.dumps(payload), time.time())
+                )
+                added += cursor.rowcount
+        return added
+
+    def mark_done(self, case_ids):
+        """Mark cases done without processing (e.g. output already exists)"""
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE cases SET status = ?, lease_owner = NULL, updated_at = ? WHERE case_id = ?",
+                [(DONE, time.time(), case_id) for case_id in case_ids]
+            )
+
+    def requeue_expired(self):
+        """Re-queue expired leases; quarantine cases that keep expiring"""
+        now = time.time()
+        with self._transaction():
+            return self._requeue_expired(now)
+
+    def _requeue_expired(self, now):
+        quarantined = self.conn.execute(
+            "UPDATE cases SET status = ?, lease_owner = NULL, last_error = 'lease expired', updated_at = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+            (QUARANTINED, now, LEASED, now, self.max_attempts)
+        ).rowcount
+        requeued = self.conn.execute(
+            "UPDATE cases SET status = ?, lease_owner = NULL, last_error = 'lease expired', updated_at = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (QUEUED, now, LEASED, now)
+        ).rowcount
+        return requeued, quarantined
+
+    def claim(self, worker_id, lease_seconds=300):
+        """Lease the next queued case; returns {'case_id', 'payload', 'attempts'} or None"""
+        now = time.time()
+        with self._transaction():
+            self._requeue_expired(now)
+            row = self.conn.execute(
+                "SELECT case_id, payload, attempts FROM cases WHERE status = ? ORDER BY position LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE cases SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE case_id = ?",
+                (LEASED, worker_id, now + lease_seconds, now, row['case_id'])
+            )
+        return {
+            'case_id': row['case_id'],
+            'payload': json.loads(row['payload']),
+            'attempts': row['attempts'] + 1
+        }
+
+    def renew(self, case_id, worker_id, lease_seconds=300):
+        """Extend a lease still held by worker_id; False if it was lost"""
+        now = time.time()
+        with self._transaction():
+            return self.conn.execute(
+                "UPDATE cases SET lease_expires = ?, updated_at = ? "
+                "WHERE case_id = ? AND status = ? AND lease_owner = ?",
+                (now + lease_seconds, now, case_id, LEASED, worker_id)
+            ).rowcount == 1
+
+    def complete(self, case_id, worker_id):
+        """Mark a leased case done; False if the lease was lost"""
+        with self._transaction():
+            return self.conn.execute(
+                "UPDATE cases SET status = ?, lease_owner = NULL, last_error = NULL, updated_at = ? "
+                "WHERE case_id = ? AND status = ? AND lease_owner = ?",
+                (DONE, time.time(), case_id, LEASED, worker_id)
+            ).rowcount == 1
+
+    def fail(self, case_id, worker_id, error):
+        """Record a failed attempt: re-queue, or mark failed after max_attempts"""
+        with self._transaction():
+            return self.conn.execute(
+                "UPDATE cases SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_owner = NULL, last_error = ?, updated_at = ? "
+                "WHERE case_id = ? AND status = ? AND lease_owner = ?",
+                (self.max_attempts, FAILED, QUEUED, str(error)[:500], time.time(),
+                 case_id, LEASED, worker_id)
+            ).rowcount == 1
+
+    def retry(self, statuses=(FAILED, QUARANTINED)):
+        """Put failed/quarantined cases back in the queue with fresh attempts"""
+        placeholders = ','.join('?' for _ in statuses)
+        with self._transaction():
+            return self.conn.execute(
+                f"UPDATE cases SET status = ?, attempts = 0, updated_at = ? WHERE status IN ({placeholders})",
+                (QUEUED, time.time(), *statuses)
+            ).rowcount
+
+    def counts(self):
+        """Number of cases per status"""
+        counts = {status: 0 for status in (QUEUED, LEASED, DONE, FAILED, QUARANTINED)}
+        for row in self.conn.execute("SELECT status, COUNT(*) FROM cases GROUP BY status"):
+            counts[row[0]] = row[1]
+        return counts
+
+    def pending(self):
+        """True while any case is queued or leased"""
+        counts = self.counts()
+        return counts[QUEUED] + counts[LEASED] > 0
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so claims never race between processes"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+class LeaseKeeper:
+    """Renew a worker's current lease in the background while it works
+
+    Uses its own connection (SQLite connections stay on their thread).
+    Renews every lease_seconds / 3; `lost` is set once a renewal finds the
+    lease has gone to another worker.
+    """
+
+    def __init__(self, path, worker_id, lease_seconds=300):
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.case_id = None
+        self.lost = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+        self._thread.start()
+
+    def hold(self, case_id):
+        """Start renewing case_id (replaces the previous case)"""
+        with self._lock:
+            self.case_id = case_id
+            self.lost = False
+        return self
+
+    def release(self):
+        with self._lock:
+            self.case_id = None
+
+    def _run(self):
+        queue = WorkQueue(self.path)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                with self._lock:
+                    case_id = self.case_id
+                if case_id is None:
+                    continue
+                renewed = queue.renew(case_id, self.worker_id, self.lease_seconds)
+                with self._lock:
+                    if self.case_id == case_id and not renewed:
+                        self.lost = True
+        finally:
+            queue.close()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()